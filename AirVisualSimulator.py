@@ -5,65 +5,101 @@
 
 # IMPORTACIONES: Librerías necesarias para el funcionamiento
 import numpy as np                      # Para operaciones matemáticas y arrays numéricos
-import pandas as pd                     # Para manejo de datos tabulares (tablas/DataFrames)
 import torch                           # Framework de machine learning PyTorch
 from torch.utils.data import Dataset   # Clase base para crear datasets personalizados
-from sklearn.preprocessing import StandardScaler  # Para normalizar datos (escalar entre 0 y 1)
 import requests                        # Para hacer peticiones HTTP a APIs externas
+from requests.adapters import HTTPAdapter  # Pool de conexiones reutilizables
+from urllib3.util.retry import Retry   # Reintentos automáticos con espera exponencial
 from datetime import datetime, timedelta  # Para manejo y cálculo de fechas
 import time                           # Para pausas y esperas en el código
+import zlib                           # Para un hash determinista (CRC32) del nombre de la ciudad
+from collections import OrderedDict   # Diccionario con orden, usado como caché LRU
+from dataclasses import dataclass     # Para contenedores de datos livianos
+from types import MappingProxyType    # Vista de solo lectura para tablas constantes
+import functools                      # Para memorizar resultados (lru_cache)
+import threading                      # Candado para la caché compartida entre hilos
+from concurrent.futures import ThreadPoolExecutor  # Consultas a varias ciudades en paralelo
+
+# ORJSON (OPCIONAL): decodificador JSON en C, más rápido que el módulo json estándar
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:                    # Sin orjson se usa la librería estándar
+    import json
+    _json_loads = json.loads
+
+# NUMBA (OPCIONAL): compila a código máquina la conversión AQI → PM2.5 por lotes
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:                    # Sin Numba se usa la versión vectorizada de NumPy
+    NUMBA_AVAILABLE = False
+
+@dataclass(slots=True, frozen=True)
+class City:
+    """
+    CLASE: Registro inmutable de una ciudad (sin __dict__ por instancia gracias a slots)
+    CAMPOS: name (nombre para mostrar), city/state/country (nombres exactos para AirVisual API)
+    """
+    name: str
+    city: str
+    state: str
+    country: str
 
 # ========================================
 # CONFIGURACIÓN DE CIUDADES DISPONIBLES
-# Diccionario con información de cada ciudad para la API
+# Diccionario clave → City con la información de cada ciudad para la API
 # ========================================
-CITIES = {
-    "1": {                              # Opción 1 para el usuario
-        "name": "Ciudad de México",      # Nombre amigable para mostrar
-        "city": "Mexico City",           # Nombre exacto que requiere AirVisual API
-        "state": "Mexico City",          # Estado/provincia para la API
-        "country": "Mexico"              # País en inglés para la API
-    },
-    "2": {                              # Opción 2 para el usuario
-        "name": "Nueva York",           # Nombre amigable para mostrar
-        "city": "New York City",        # Nombre exacto que requiere AirVisual API
-        "state": "New York",            # Estado de Nueva York
-        "country": "USA"                # Estados Unidos
-    },
-    "3": {                              # Opción 3 para el usuario
-        "name": "Los Ángeles",          # Nombre amigable para mostrar
-        "city": "Los Angeles",          # Nombre exacto para la API
-        "state": "California",          # Estado de California
-        "country": "USA"                # Estados Unidos
-    },
-    "4": {                              # Opción 4 para el usuario
-        "name": "Madrid",               # Nombre amigable para mostrar
-        "city": "Madrid",               # Nombre exacto para la API
-        "state": "Madrid",              # Comunidad de Madrid
-        "country": "Spain"              # España
-    },
-    "5": {                              # Opción 5 para el usuario
-        "name": "Londres",              # Nombre amigable para mostrar
-        "city": "London",               # Nombre en inglés para la API
-        "state": "England",             # Inglaterra como estado
-        "country": "UK"                 # Reino Unido
-    },
-    "6": {                              # Opción 6 para el usuario
-        "name": "Mendoza, Argentina",   # Nombre amigable (única ciudad argentina disponible)
-        "city": "Mendoza",              # Nombre exacto para la API
-        "state": "Mendoza",             # Provincia de Mendoza
-        "country": "Argentina"          # Argentina
-    },
-    "7":{
-        "name": "Aksu",              # Nombre amigable (única ciudad china disponible)
-        "city": "Aksu",              # Nombre exacto para la API
-        "state": "Xinjiang",         # Región de Xinjiang
-        "country": "China"           # China
-    }
+CITIES = MappingProxyType({          # Solo lectura: el catálogo de ciudades no cambia en ejecución
+    "1": City(                          # Opción 1 para el usuario
+        name="Ciudad de México",        # Nombre amigable para mostrar
+        city="Mexico City",             # Nombre exacto que requiere AirVisual API
+        state="Mexico City",            # Estado/provincia para la API
+        country="Mexico"                # País en inglés para la API
+    ),
+    "2": City(                          # Opción 2 para el usuario
+        name="Nueva York",              # Nombre amigable para mostrar
+        city="New York City",           # Nombre exacto que requiere AirVisual API
+        state="New York",               # Estado de Nueva York
+        country="USA"                   # Estados Unidos
+    ),
+    "3": City(                          # Opción 3 para el usuario
+        name="Los Ángeles",             # Nombre amigable para mostrar
+        city="Los Angeles",             # Nombre exacto para la API
+        state="California",             # Estado de California
+        country="USA"                   # Estados Unidos
+    ),
+    "4": City(                          # Opción 4 para el usuario
+        name="Madrid",                  # Nombre amigable para mostrar
+        city="Madrid",                  # Nombre exacto para la API
+        state="Madrid",                 # Comunidad de Madrid
+        country="Spain"                 # España
+    ),
+    "5": City(                          # Opción 5 para el usuario
+        name="Londres",                 # Nombre amigable para mostrar
+        city="London",                  # Nombre en inglés para la API
+        state="England",                # Inglaterra como estado
+        country="UK"                    # Reino Unido
+    ),
+    "6": City(                          # Opción 6 para el usuario
+        name="Mendoza, Argentina",      # Nombre amigable (única ciudad argentina disponible)
+        city="Mendoza",                 # Nombre exacto para la API
+        state="Mendoza",                # Provincia de Mendoza
+        country="Argentina"             # Argentina
+    ),
+    "7": City(
+        name="Aksu",                    # Nombre amigable (única ciudad china disponible)
+        city="Aksu",                    # Nombre exacto para la API
+        state="Xinjiang",               # Región de Xinjiang
+        country="China"                 # China
+    )
 
     #Aksu
 
-}
+})
+
+# Menú de consola ya armado (una línea por ciudad), se imprime tal cual en cada selección
+CITY_MENU = "\n".join(f"{key}. {city.name}" for key, city in CITIES.items())
 
 # ========================================
 # CONFIGURACIÓN GLOBAL DEL SISTEMA
@@ -71,26 +107,127 @@ CITIES = {
 # ========================================
 SEQ_LENGTH = 10                        # Días de historial que usa el modelo para predecir (ventana temporal)
 N_FEATURES = 2                         # Número de variables que predecimos (PM2.5 y NO2)
-SCALER = StandardScaler()              # Objeto global para normalizar datos (convierte a escala 0-1)
+
+# ========================================
+# PERFILES ESPECÍFICOS POR CIUDAD (basados en datos históricos reales)
+# Cada perfil: [pm25_base, pm25_std, no2_base, no2_std], precalculado una sola vez
+# ========================================
+_RAW_CITY_PROFILES = {
+    "Ciudad de México": {"pm25_base": 35, "pm25_std": 12, "no2_base": 45, "no2_std": 8},  # Muy contaminada
+    "Nueva York": {"pm25_base": 20, "pm25_std": 8, "no2_base": 30, "no2_std": 6},         # Moderada
+    "Los Ángeles": {"pm25_base": 28, "pm25_std": 10, "no2_base": 38, "no2_std": 7},       # Alta por tráfico
+    "Madrid": {"pm25_base": 18, "pm25_std": 7, "no2_base": 28, "no2_std": 5},             # Europea regulada
+    "Londres": {"pm25_base": 15, "pm25_std": 6, "no2_base": 25, "no2_std": 4},            # Muy regulada
+    "Mendoza, Argentina": {"pm25_base": 22, "pm25_std": 8, "no2_base": 28, "no2_std": 5}  # Región vinícola
+}
+CITY_PROFILES = {
+    name: np.array([p['pm25_base'], p['pm25_std'], p['no2_base'], p['no2_std']], dtype=np.float64)
+    for name, p in _RAW_CITY_PROFILES.items()
+}
+DEFAULT_PROFILE = np.array([25, 10, 30, 6], dtype=np.float64)  # Perfil genérico para ciudades sin datos
+for _profile in (*CITY_PROFILES.values(), DEFAULT_PROFILE):
+    _profile.setflags(write=False)     # Compartidos entre llamadas: solo lectura
+
+@dataclass(frozen=True)
+class CityTimeSeries:
+    """
+    CLASE: Serie temporal diaria de una ciudad (arrays NumPy alineados por día)
+    CAMPOS: date (datetime64[D]), pm25 (μg/m³), no2 (μg/m³); todos arrays de igual largo
+    """
+    date: np.ndarray
+    pm25: np.ndarray
+    no2: np.ndarray
+    
+    def __len__(self):
+        """
+        MÉTODO: Número de días de la serie (igual que len() de un DataFrame)
+        """
+        return len(self.date)
+
+# CACHÉ DE RESPUESTAS DE LA API: (city, state, country) → (momento de guardado, datos)
+_api_cache = OrderedDict()
+_api_cache_lock = threading.Lock()    # Protege la caché cuando se consultan varias ciudades en paralelo
+
+# ========================================
+# SESIÓN HTTP COMPARTIDA
+# Reutiliza la conexión TCP/TLS entre consultas (keep-alive) y reintenta sola
+# ========================================
+API_MAX_RETRIES = 3                    # Intentos extra ante errores de red o 429/5xx
+API_TIMEOUT = (3.05, 10)               # Timeout de conexión y de lectura (segundos)
+API_MAX_CONCURRENCY = 5                # Consultas simultáneas máximas (respeta el rate limit de AirVisual)
+
+_retry = Retry(
+    total=API_MAX_RETRIES,             # Máximo de reintentos
+    backoff_factor=1,                  # Espera exponencial: 1, 2, 4 segundos
+    status_forcelist=[429, 502, 503, 504],  # Rate limit y errores temporales del servidor
+    allowed_methods=['GET'],           # Solo consultas (idempotentes)
+    raise_on_status=False              # Al agotar intentos devuelve la última respuesta
+)
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=_retry)
+_session = requests.Session()
+_session.mount('http://', _adapter)    # AIRVISUAL_BASE_URL usa http
+_session.mount('https://', _adapter)
+
+# ========================================
+# TABLA DE CORTES EPA PARA AQI → PM2.5
+# Cada tramo: límite superior de AQI, AQI inicial, PM2.5 inicial y pendiente
+# ========================================
+AQI_UPPER_BP = np.array([50, 100, 150, 200, 300], dtype=np.float64)  # Límite superior de cada tramo (el último es abierto)
+AQI_LOW_BP = np.array([0, 51, 101, 151, 201, 301], dtype=np.float64)  # AQI donde empieza cada tramo
+PM25_LOW_BP = np.array([0.0, 12.1, 35.5, 55.5, 150.5, 250.5])  # PM2.5 donde empieza cada tramo
+PM25_SLOPE = np.array([                                     # μg/m³ por punto de AQI en cada tramo
+    12.0 / 50,                          # Bueno
+    (35.4 - 12.1) / 49,                 # Moderado
+    (55.4 - 35.5) / 49,                 # Dañino para grupos sensibles
+    (150.4 - 55.5) / 49,                # Dañino
+    (250.4 - 150.5) / 99,               # Muy dañino
+    1.5                                 # Peligroso
+])
+
+if NUMBA_AVAILABLE:
+    @njit('void(float64[:], float64[:], float64[:], float64[:], float64[:], float64[:])', cache=True)  # Firma explícita: se compila al importar
+    def _aqi_to_pm25_batch(aqi, upper_bp, low_bp, pm25_low, slope, out):
+        """
+        FUNCIÓN: Núcleo compilado que convierte un array de AQI a PM2.5 en una sola pasada
+        PARÁMETROS: aqi (array float64 de entrada), upper_bp/low_bp/pm25_low/slope (tabla de cortes EPA),
+                    out (array float64 donde se escribe el resultado)
+        NOTA: Usa la misma tabla y la misma búsqueda de tramo que la ruta NumPy (searchsorted side='left')
+        """
+        for i in range(aqi.size):
+            a = aqi[i]
+            k = 0
+            while k < upper_bp.size and a > upper_bp[k]:  # Primer tramo cuyo límite superior es >= a
+                k += 1
+            out[i] = pm25_low[k] + (a - low_bp[k]) * slope[k]
 
 def aqi_to_pm25(aqi_us):
     """
     FUNCIÓN: Convierte AQI US a concentración de PM2.5 en μg/m³
     PROPÓSITO: La API devuelve AQI, pero necesitamos PM2.5 real para entrenar
     FÓRMULA: Oficial de la EPA (Agencia de Protección Ambiental de EE.UU.)
+    ENTRADA: Un número o un array de AQI (se convierte todo de una vez)
+    SALIDA: float si la entrada es escalar, np.ndarray si es un array
+    NOTA: Un AQI entero entre 0 y 500 se lee de _PM25_LUT; los fraccionarios usan la fórmula exacta
     """
-    if aqi_us <= 50:                   # Rango 1: AQI 0-50 = Aire BUENO
-        return (aqi_us / 50) * 12.0    # Conversión lineal a 0-12 μg/m³
-    elif aqi_us <= 100:                # Rango 2: AQI 51-100 = Aire MODERADO
-        return 12.1 + ((aqi_us - 51) / 49) * (35.4 - 12.1)  # Fórmula EPA oficial
-    elif aqi_us <= 150:                # Rango 3: AQI 101-150 = DAÑINO para grupos sensibles
-        return 35.5 + ((aqi_us - 101) / 49) * (55.4 - 35.5)
-    elif aqi_us <= 200:                # Rango 4: AQI 151-200 = DAÑINO para todos
-        return 55.5 + ((aqi_us - 151) / 49) * (150.4 - 55.5)
-    elif aqi_us <= 300:                # Rango 5: AQI 201-300 = MUY DAÑINO
-        return 150.5 + ((aqi_us - 201) / 99) * (250.4 - 150.5)
-    else:                              # Rango 6: AQI 301+ = PELIGROSO
-        return 250.5 + (aqi_us - 301) * 1.5
+    if np.isscalar(aqi_us) and 0 <= aqi_us <= 500 and aqi_us == int(aqi_us):  # Caso común: AQI entero
+        return _PM25_LUT[int(aqi_us)]  # Tabla precalculada con la misma fórmula (sin interpolar)
+    
+    if NUMBA_AVAILABLE and not np.isscalar(aqi_us):  # Lotes: núcleo compilado sin arrays intermedios
+        aqi = np.ascontiguousarray(aqi_us, dtype=np.float64)
+        out = np.empty_like(aqi)
+        _aqi_to_pm25_batch(aqi.reshape(-1), AQI_UPPER_BP, AQI_LOW_BP, PM25_LOW_BP, PM25_SLOPE, out.reshape(-1))
+        return out.reshape(np.shape(aqi_us))  # Misma forma que la entrada (incluidos arrays 0-d)
+    
+    aqi = np.asarray(aqi_us, dtype=np.float64)  # Acepta escalares, listas o arrays
+    idx = np.searchsorted(AQI_UPPER_BP, aqi, side='left')  # Tramo EPA de cada valor
+    pm25 = PM25_LOW_BP[idx] + (aqi - AQI_LOW_BP[idx]) * PM25_SLOPE[idx]  # Interpolación lineal por tramo
+    
+    if np.isscalar(aqi_us):            # Compatibilidad: un número entra, un número sale
+        return float(pm25)
+    return pm25
+
+# TABLA PRECALCULADA: PM2.5 para cada AQI entero de 0 a 500 (floats de Python, sin overhead de NumPy)
+_PM25_LUT = tuple(aqi_to_pm25(np.arange(501, dtype=np.float64)).tolist())
 
 def get_aqi_quality_level(aqi):
     """
@@ -128,64 +265,76 @@ def get_api_key():
         print("❌ No se encontró AIRVISUAL_API_KEY en config.py")
         return None                    # Devuelve "nada" para indicar error
 
-def get_airvisual_data(city_info, max_retries=3):
+def get_airvisual_data(city_info):
     """
     FUNCIÓN: Conecta con AirVisual API para obtener datos reales de calidad del aire
     PROPÓSITO: Obtener información actual de contaminación de una ciudad específica
-    PARÁMETROS: city_info (diccionario con ciudad), max_retries (intentos máximos)
+    PARÁMETROS: city_info (City); los reintentos los hace _session
     RETORNA: Datos JSON de la API o None si falla
     """
     api_key = get_api_key()            # Obtiene la clave de API desde config.py
     if not api_key:                    # Si no hay clave disponible
         return None                    # Sale de la función sin hacer nada
     
-    from config import AIRVISUAL_BASE_URL  # Importa la URL base desde config.py
+    from config import AIRVISUAL_BASE_URL, CACHE_TTL_WEATHER, CACHE_MAX_CITIES  # Importa configuración
+    
+    # REVISAR CACHÉ ANTES DE IR A LA RED
+    key = (city_info.city, city_info.state, city_info.country)
+    with _api_cache_lock:
+        cached = _api_cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < CACHE_TTL_WEATHER:
+            _api_cache.move_to_end(key)  # Marca la ciudad como usada recientemente
+            return cached[1]           # Devuelve la respuesta guardada sin llamar a la API
     
     url = f"{AIRVISUAL_BASE_URL}city"  # Construye la URL completa para consulta de ciudad
     params = {                         # Parámetros que necesita la API
-        'city': city_info['city'],     # Nombre de la ciudad en inglés
-        'state': city_info['state'],   # Estado/provincia 
-        'country': city_info['country'], # País en inglés
+        'city': city_info.city,     # Nombre de la ciudad en inglés
+        'state': city_info.state,   # Estado/provincia 
+        'country': city_info.country, # País en inglés
         'key': api_key                 # Clave de autenticación
     }
     
-    print(f"   🌍 Consultando AirVisual API para {city_info.get('name', city_info['city'])}...")
-    
-    for attempt in range(max_retries):  # Reintenta hasta 3 veces si algo falla
-        try:                           # Intenta hacer la petición HTTP
-            response = requests.get(url, params=params, timeout=10)  # GET con timeout de 10 segundos
-            
-            if response.status_code == 200:    # Código 200 = éxito
-                data = response.json()         # Convierte respuesta JSON a diccionario Python
-                if data['status'] == 'success': # Verifica que la API diga "éxito"
-                    return data['data']        # Devuelve solo la parte de datos útiles
-                else:                          # API responde pero con error
-                    print(f"   ⚠️  Error en API: {data.get('data', {}).get('message', 'Unknown error')}")
-                    return None                # Termina la función
-                    
-            elif response.status_code == 429:  # Código 429 = demasiadas peticiones
-                print(f"   ⏳ Rate limit alcanzado, esperando... (intento {attempt + 1}/{max_retries})")
-                time.sleep(2 ** attempt)       # Espera exponencial: 2, 4, 8 segundos
-                continue                       # Va al siguiente intento
-                
-            else:                             # Cualquier otro código de error
-                print(f"   ❌ Error HTTP {response.status_code}")
-                return None                   # Termina la función
-                
-        except requests.exceptions.RequestException as e:  # Error de conexión/red
-            print(f"   ❌ Error de conexión (intento {attempt + 1}/{max_retries}): {e}")
-            if attempt < max_retries - 1:     # Si no es el último intento
-                time.sleep(1)                 # Espera 1 segundo
-                continue                      # Va al siguiente intento
-                
-    return None                               # Si todos los intentos fallaron, devuelve None
+    print(f"   🌍 Consultando AirVisual API para {getattr(city_info, 'name', city_info.city)}...")
+    
+    try:                               # Intenta hacer la petición HTTP (la sesión ya reintenta)
+        response = _session.get(url, params=params, timeout=API_TIMEOUT)
+    except requests.exceptions.RequestException as e:  # Error de conexión/red tras los reintentos
+        print(f"   ❌ Error de conexión: {e}")
+        return None
+    
+    if response.status_code == 429:   # Código 429 = demasiadas peticiones (aun tras reintentar)
+        print(f"   ⏳ Rate limit alcanzado tras {API_MAX_RETRIES} reintentos")
+        return None
+    
+    if response.status_code != 200:    # Cualquier otro código de error
+        print(f"   ❌ Error HTTP {response.status_code}")
+        return None
+    
+    try:                               # Convierte respuesta JSON (bytes) a diccionario Python
+        data = _json_loads(response.content)
+    except ValueError as e:            # Cuerpo que no es JSON (p. ej. HTML de un proxy)
+        print(f"   ❌ Respuesta no es JSON válido: {e}")
+        return None
+    
+    if not isinstance(data, dict) or data.get('status') != 'success':  # API responde pero con error
+        detail = data.get('data') if isinstance(data, dict) else None
+        message = detail.get('message', 'Unknown error') if isinstance(detail, dict) else 'Unknown error'
+        print(f"   ⚠️  Error en API: {message}")
+        return None
+    
+    with _api_cache_lock:
+        _api_cache[key] = (time.monotonic(), data['data'])  # Guarda en caché
+        _api_cache.move_to_end(key)
+        if len(_api_cache) > CACHE_MAX_CITIES:  # Descarta la ciudad menos usada
+            _api_cache.popitem(last=False)
+    return data['data']                # Devuelve solo la parte de datos útiles
 
 def process_real_airvisual_data(real_data, city):
     """
     FUNCIÓN: Procesa y extrae información útil de la respuesta de AirVisual API
     PROPÓSITO: Convertir datos crudos de API en información comprensible
     ENTRADA: real_data (JSON de API), city (información de ciudad)
-    SALIDA: DataFrame con serie temporal de 60 días
+    SALIDA: CityTimeSeries con serie temporal de 60 días
     """
     current = real_data.get('current', {})          # Extrae datos actuales del JSON
     pollution = current.get('pollution', {})        # Extrae datos de contaminación
@@ -213,6 +362,69 @@ def process_real_airvisual_data(real_data, city):
     # GENERAR HISTÓRICO BASADO EN DATOS REALES
     return generate_time_series_from_real_data(city, pm25_converted)  # Crea 60 días de datos
 
+@functools.lru_cache(maxsize=4)
+def _time_basis(n_days):
+    """
+    FUNCIÓN: Calcula (una sola vez por largo de serie) las curvas base de la serie temporal
+    PROPÓSITO: Todas las ciudades usan el mismo n_days; no hace falta recalcular senos cada vez
+    RETORNA: ramp (0 → 1, equivale a np.linspace), sin_week (período 7), sin_month (período 30)
+    NOTA: Los arrays se marcan de solo lectura porque se comparten entre llamadas
+    """
+    t = np.arange(n_days)              # Índice de día
+    ramp = t / (n_days - 1)            # 0 → 1 a lo largo de la serie
+    sin_week = np.sin((2 * np.pi / 7) * t)    # Patrón semanal
+    sin_month = np.sin((2 * np.pi / 30) * t)  # Patrón mensual
+    for arr in (ramp, sin_week, sin_month):
+        arr.setflags(write=False)
+    return ramp, sin_week, sin_month
+
+def get_city_seed(city):
+    """
+    FUNCIÓN: Calcula una semilla aleatoria fija para cada ciudad
+    PROPÓSITO: hash() de Python cambia en cada ejecución (PYTHONHASHSEED), CRC32 no
+    RETORNA: Entero de 32 bits derivado del nombre de la ciudad
+    """
+    return zlib.crc32(city.name.encode('utf-8')) & 0xFFFFFFFF
+
+def _prepare_city_series(city, n_days):
+    """
+    FUNCIÓN: Prepara lo que comparten ambos generadores de series
+    RETORNA: date_range (datetime64[D] terminando hoy), rng (generador con la semilla de la ciudad),
+             series (buffer vacío 3 × n_days: fila 0 = PM2.5, fila 1 = NO2, fila 2 = auxiliar)
+    """
+    start_date = datetime.now().date() - timedelta(days=n_days-1)  # La serie termina hoy
+    date_range = np.datetime64(start_date, 'D') + np.arange(n_days)  # Fechas diarias (datetime64[D])
+    rng = np.random.default_rng(get_city_seed(city))  # Generador propio, igual en cada ejecución
+    series = np.empty((3, n_days))     # Única reserva de memoria: todo se escribe en el lugar
+    return date_range, rng, series
+
+def _synth_pollutant(rng, out, scratch, base, noise_std, lo, hi, seasonal_amp=0.0, seasonal=None):
+    """
+    FUNCIÓN: Escribe en `out` una serie de contaminante sin crear arrays temporales
+    FÓRMULA: ruido N(0, noise_std) + tendencia (base×1.1 → base×0.9) + seasonal_amp × seasonal,
+             recortado a [lo, hi]
+    PARÁMETROS: rng (generador), out (array destino), scratch (array auxiliar del mismo largo),
+                seasonal (curva base opcional, p. ej. sin_week o sin_month)
+    """
+    ramp = _time_basis(len(out))[0]    # 0 → 1 a lo largo de la serie (compartido, en caché)
+    rng.standard_normal(out=out)       # Ruido diario directo en la salida
+    out *= noise_std
+    np.multiply(ramp, base * 0.2, out=scratch)  # Tendencia gradual descendente...
+    np.subtract(base * 1.1, scratch, out=scratch)
+    out += scratch                     # ...sumada en el lugar
+    if seasonal is not None:
+        np.multiply(seasonal, seasonal_amp, out=scratch)  # Patrón semanal/mensual
+        out += scratch
+    np.clip(out, lo, hi, out=out)      # Límites realistas, sin copia
+    return out
+
+def _print_series_stats(pm25_series, no2_series):
+    """
+    FUNCIÓN: Muestra media y rango de PM2.5 y NO2 al usuario
+    """
+    print(f"   📊 PM2.5 - Media: {np.mean(pm25_series):.1f}, Rango: {np.min(pm25_series):.1f}-{np.max(pm25_series):.1f}")
+    print(f"   📊 NO2 - Media: {np.mean(no2_series):.1f}, Rango: {np.min(no2_series):.1f}-{np.max(no2_series):.1f}")
+
 def generate_time_series_from_real_data(city, base_pm25):
     """
     FUNCIÓN: Crea 60 días de datos históricos basados en el valor real actual
@@ -220,44 +432,28 @@ def generate_time_series_from_real_data(city, base_pm25):
     MÉTODO: Genera variaciones realistas alrededor del valor real
     """
     n_days = SEQ_LENGTH + 50           # 10 (para modelo) + 50 (para entrenamiento) = 60 días
-    today = datetime.now().date()      # Fecha de hoy
-    end_date = today                  # La serie termina hoy
-    start_date = end_date - timedelta(days=n_days-1)  # Comienza 60 días atrás
+    date_range, rng, series = _prepare_city_series(city, n_days)
+    pm25_series, no2_series, scratch = series  # Vistas sobre cada fila (sin copias)
+    _, sin_week, _ = _time_basis(n_days)
     
-    # CREAR LISTA DE FECHAS
-    date_range = pd.date_range(start=start_date, end=end_date, freq='D')  # Fechas diarias
-    
-    # GENERAR SEMILLA ÚNICA POR CIUDAD (para consistencia)
-    city_seed = hash(city['name']) % 1000  # Convierte nombre en número (0-999)
-    np.random.seed(city_seed)              # Establece semilla para números aleatorios
-    
-    # GENERAR VARIACIONES REALISTAS DE PM2.5
+    # GENERAR VARIACIONES REALISTAS DE PM2.5 (patrón semanal, límites 5-150)
     pm25_std = max(3, base_pm25 * 0.2)     # Desviación mínima 3, máxima 20% del valor base
-    trend = np.linspace(base_pm25 * 1.1, base_pm25 * 0.9, n_days)  # Tendencia gradual descendente
-    seasonal_variation = 5 * np.sin(2 * np.pi * np.arange(n_days) / 7)  # Patrón semanal
-    noise = np.random.normal(0, pm25_std * 0.3, n_days)  # Ruido aleatorio diario
-    pm25_series = np.clip(trend + seasonal_variation + noise, 5, 150)  # Combina todo, límites 5-150
+    _synth_pollutant(rng, pm25_series, scratch, base_pm25, pm25_std * 0.3, 5, 150,
+                     seasonal_amp=5, seasonal=sin_week)
     
-    # GENERAR NO2 CORRELACIONADO CON PM2.5
+    # GENERAR NO2 CORRELACIONADO CON PM2.5 (límites 5-80)
     no2_base = min(60, max(10, base_pm25 * 0.6 + 15))  # NO2 base entre 10-60, correlacionado
-    no2_trend = np.linspace(no2_base * 1.1, no2_base * 0.9, n_days)  # Tendencia similar
-    no2_noise = np.random.normal(0, no2_base * 0.15, n_days)  # Ruido proporcional
-    no2_series = np.clip(no2_trend + no2_noise, 5, 80)  # NO2 entre 5-80
+    _synth_pollutant(rng, no2_series, scratch, no2_base, no2_base * 0.15, 5, 80)
     
-    # CREAR TABLA DE DATOS (DataFrame)
-    data = pd.DataFrame({               # Crea tabla con 3 columnas
-        'date': date_range,            # Columna 1: fechas diarias
-        'PM2.5': pm25_series,          # Columna 2: valores de PM2.5 generados
-        'NO2': no2_series              # Columna 3: valores de NO2 generados
-    })
+    # CREAR SERIE TEMPORAL
+    data = CityTimeSeries(date=date_range, pm25=pm25_series, no2=no2_series)
     
     # MOSTRAR ESTADÍSTICAS AL USUARIO
     print(f"   ✅ Serie temporal generada con {len(data)} días")
-    print(f"   📊 PM2.5 - Media: {np.mean(pm25_series):.1f}, Rango: {np.min(pm25_series):.1f}-{np.max(pm25_series):.1f}")
-    print(f"   📊 NO2 - Media: {np.mean(no2_series):.1f}, Rango: {np.min(no2_series):.1f}-{np.max(no2_series):.1f}")
+    _print_series_stats(pm25_series, no2_series)
     print(f"   📊 Basado en datos reales de AirVisual API")
     
-    return data                        # Devuelve la tabla con todos los datos generados
+    return data                        # Devuelve la serie con todos los datos generados
 
 def generate_city_specific_synthetic_data(city):
     """
@@ -265,59 +461,31 @@ def generate_city_specific_synthetic_data(city):
     PROPÓSITO: Simular patrones de contaminación específicos por ciudad
     MÉTODO: Usa perfiles predefinidos basados en características de cada ciudad
     """
-    print(f"   🎯 Generando perfil sintético para {city['name']}")
-    
-    # PERFILES ESPECÍFICOS POR CIUDAD (basados en datos históricos reales)
-    city_profiles = {
-        "Ciudad de México": {"pm25_base": 35, "pm25_std": 12, "no2_base": 45, "no2_std": 8},  # Muy contaminada
-        "Nueva York": {"pm25_base": 20, "pm25_std": 8, "no2_base": 30, "no2_std": 6},         # Moderada
-        "Los Ángeles": {"pm25_base": 28, "pm25_std": 10, "no2_base": 38, "no2_std": 7},       # Alta por tráfico
-        "Madrid": {"pm25_base": 18, "pm25_std": 7, "no2_base": 28, "no2_std": 5},             # Europea regulada
-        "Londres": {"pm25_base": 15, "pm25_std": 6, "no2_base": 25, "no2_std": 4},            # Muy regulada
-        "Mendoza, Argentina": {"pm25_base": 22, "pm25_std": 8, "no2_base": 28, "no2_std": 5}  # Región vinícola
-    }
+    print(f"   🎯 Generando perfil sintético para {city.name}")
     
     # OBTENER PERFIL DE LA CIUDAD (o usar perfil genérico)
-    profile = city_profiles.get(city['name'], {"pm25_base": 25, "pm25_std": 10, "no2_base": 30, "no2_std": 6})
+    pm25_base, pm25_std, no2_base, no2_std = CITY_PROFILES.get(city.name, DEFAULT_PROFILE)
     
-    # CONFIGURAR PERIODO DE TIEMPO
     n_days = SEQ_LENGTH + 50           # 60 días total
-    today = datetime.now().date()      # Fecha actual
-    end_date = today                  # Termina hoy
-    start_date = end_date - timedelta(days=n_days-1)  # Comienza 60 días atrás
-    
-    date_range = pd.date_range(start=start_date, end=end_date, freq='D')  # Lista de fechas
-    
-    # GENERAR SEMILLA ESPECÍFICA POR CIUDAD (para consistencia entre ejecuciones)
-    city_seed = hash(city['name']) % 1000  # Cada ciudad tiene su semilla única
-    np.random.seed(city_seed)              # Fija la semilla
-    
-    # GENERAR PM2.5 CON PERFIL ESPECÍFICO
-    pm25_base = profile['pm25_base']       # Valor base del perfil de la ciudad
-    pm25_trend = np.linspace(pm25_base * 1.1, pm25_base * 0.9, n_days)  # Tendencia descendente
-    pm25_seasonal = profile['pm25_std'] * 0.5 * np.sin(2 * np.pi * np.arange(n_days) / 30)  # Variación mensual
-    pm25_noise = np.random.normal(0, profile['pm25_std'] * 0.3, n_days)  # Ruido diario
-    pm25_series = np.clip(pm25_trend + pm25_seasonal + pm25_noise, 5, 100)  # Límites realistas
-    
-    # GENERAR NO2 CON PERFIL ESPECÍFICO
-    no2_base = profile['no2_base']         # Valor base del perfil
-    no2_trend = np.linspace(no2_base * 1.1, no2_base * 0.9, n_days)  # Tendencia similar
-    no2_noise = np.random.normal(0, profile['no2_std'] * 0.4, n_days)  # Ruido proporcional
-    no2_series = np.clip(no2_trend + no2_noise, 5, 80)  # Límites realistas para NO2
-    
-    # CREAR TABLA DE DATOS
-    data = pd.DataFrame({
-        'date': date_range,            # Fechas
-        'PM2.5': pm25_series,          # PM2.5 sintético
-        'NO2': no2_series              # NO2 sintético
-    })
+    date_range, rng, series = _prepare_city_series(city, n_days)
+    pm25_series, no2_series, scratch = series  # Vistas sobre cada fila
+    _, _, sin_month = _time_basis(n_days)
+    
+    # GENERAR PM2.5 CON PERFIL ESPECÍFICO (variación mensual, límites 5-100)
+    _synth_pollutant(rng, pm25_series, scratch, pm25_base, pm25_std * 0.3, 5, 100,
+                     seasonal_amp=pm25_std * 0.5, seasonal=sin_month)
+    
+    # GENERAR NO2 CON PERFIL ESPECÍFICO (límites 5-80)
+    _synth_pollutant(rng, no2_series, scratch, no2_base, no2_std * 0.4, 5, 80)
+    
+    # CREAR SERIE TEMPORAL
+    data = CityTimeSeries(date=date_range, pm25=pm25_series, no2=no2_series)
     
     # MOSTRAR ESTADÍSTICAS
     print(f"   ✅ Datos sintéticos específicos generados")
-    print(f"   📊 PM2.5 - Media: {np.mean(pm25_series):.1f}, Rango: {np.min(pm25_series):.1f}-{np.max(pm25_series):.1f}")
-    print(f"   📊 NO2 - Media: {np.mean(no2_series):.1f}, Rango: {np.min(no2_series):.1f}-{np.max(no2_series):.1f}")
+    _print_series_stats(pm25_series, no2_series)
     
-    return data                        # Devuelve la tabla generada
+    return data                        # Devuelve la serie generada
 
 def generate_airvisual_data(city=None):
     """
@@ -328,42 +496,113 @@ def generate_airvisual_data(city=None):
     if city is None:                   # Si no se especifica ciudad
         city = CITIES["1"]             # Usa Ciudad de México por defecto
     
-    print(f"\n🏙️  Obteniendo datos para: {city['name']}")
+    print(f"\n🏙️  Obteniendo datos para: {city.name}")
     
     # PASO 1: INTENTAR OBTENER DATOS REALES
     real_data = get_airvisual_data(city)  # Llama a la API de AirVisual
     
     if not real_data:                  # Si la API falla o no hay datos
-        print(f"   ⚠️  No hay datos disponibles para {city['name']} en AirVisual API")
-        print(f"   🎯 Generando datos sintéticos específicos para {city['name']}...")
+        print(f"   ⚠️  No hay datos disponibles para {city.name} en AirVisual API")
+        print(f"   🎯 Generando datos sintéticos específicos para {city.name}...")
         return generate_city_specific_synthetic_data(city)  # Genera datos falsos pero realistas
     
     # PASO 2: SI HAY DATOS REALES, PROCESARLOS
     return process_real_airvisual_data(real_data, city)  # Procesa datos reales
 
+def generate_airvisual_data_batch(cities):
+    """
+    FUNCIÓN: Obtiene los datos de varias ciudades en paralelo
+    PROPÓSITO: Las consultas a la API son I/O (requests libera el GIL), así que con hilos el
+               tiempo total es ~1 consulta en vez de N consultas seguidas
+    PARÁMETROS: cities (lista de City)
+    RETORNA: Lista de CityTimeSeries (o None) en el mismo orden que `cities`
+    """
+    cities = list(cities)
+    if not cities:                     # Nada que consultar
+        return []
+    
+    with ThreadPoolExecutor(max_workers=min(API_MAX_CONCURRENCY, len(cities))) as executor:
+        return list(executor.map(generate_airvisual_data, cities))
+
 class AirQualityDataset(Dataset):
     """
     CLASE: Dataset personalizado para entrenar el modelo de machine learning
-    PROPÓSITO: Convierte DataFrame en formato que entiende PyTorch
+    PROPÓSITO: Convierte la serie temporal en formato que entiende PyTorch
     HERENCIA: Extiende Dataset de PyTorch para funcionalidad ML
+    USO CON GPU: Expone X (N, T, F) e y (N, 1) como tensores float32 contiguos; ModeloLSTM.DeviceBatchLoader
+                 los copia una vez al dispositivo y forma los lotes por indexación
     """
     def __init__(self, data, seq_length=10):
         """
         CONSTRUCTOR: Inicializa el dataset cuando se crea el objeto
-        PARÁMETROS: data (DataFrame), seq_length (días de historial)
+        PARÁMETROS: data (CityTimeSeries o array (días, 2) con columnas [PM2.5, NO2]),
+                    seq_length (días de historial)
         """
         self.seq_length = seq_length   # Guarda cuántos días de historial usar
         
-        # PREPARAR DATOS NUMÉRICOS PARA EL MODELO
-        numeric_data = data[['PM2.5', 'NO2']].values  # Extrae solo columnas numéricas como array
+        # PREPARAR DATOS NUMÉRICOS PARA EL MODELO (float32, solo NumPy)
+        if isinstance(data, CityTimeSeries):
+            arr = self._stack_features(data.pm25, data.no2)  # Une PM2.5 y NO2 en una sola copia
+        else:
+            arr = np.asarray(data, dtype=np.float32)  # Ya viene como array: sin copia si es float32
         
-        # NORMALIZAR DATOS (convertir a escala 0-1)
-        global SCALER                  # Usa el objeto global SCALER
-        self.data = SCALER.fit_transform(numeric_data)  # Normaliza y guarda
+        # NORMALIZAR DATOS (media 0, desviación 1) con estadísticas propias de este dataset
+        self.mean = arr.mean(axis=0)   # Media de cada columna (PM2.5, NO2)
+        self.std = arr.std(axis=0) + 1e-8  # Desviación de cada columna (+1e-8 evita dividir por 0)
+        self.data = np.subtract(arr, self.mean, dtype=np.float32)  # Un único array nuevo (no modifica la entrada)
+        self.data /= self.std          # Termina de normalizar en el lugar
+        self.pm25_mean = float(self.mean[0])  # Constantes de PM2.5 como float de Python: desnormalizar
+        self.pm25_scale = float(self.std[0])  # una predicción no necesita escalares de NumPy
         
         # VERIFICAR QUE HAY SUFICIENTES DATOS
         if len(self.data) < seq_length + 1:  # Necesita historial + 1 día para predecir
             raise ValueError(f"Necesitamos al menos {seq_length + 1} días de datos")
+        
+        # PRECALCULAR TODAS LAS VENTANAS UNA SOLA VEZ (vistas sin copia → un tensor contiguo)
+        windows = np.lib.stride_tricks.sliding_window_view(self.data, (seq_length, N_FEATURES)).squeeze(1)
+        # float32 contiguo: mitad de bytes que float64 y apto para DataLoader(pin_memory=True)
+        # Diseño (N, T, F) = (muestras, días, variables), el que espera nn.LSTM(batch_first=True)
+        self.X = torch.from_numpy(np.ascontiguousarray(windows[:-1], dtype=np.float32))  # (N, seq_length, N_FEATURES)
+        self.y = torch.from_numpy(np.ascontiguousarray(self.data[seq_length:, 0:1], dtype=np.float32))  # (N, 1)
+    
+    @functools.cached_property
+    def X_nft(self):
+        """
+        PROPIEDAD: Ventanas en diseño (N, F, T) = (muestras, variables, días), contiguo
+        PROPÓSITO: Para modelos convolucionales 1D (Conv1d espera canales antes que tiempo)
+        NOTA: Se calcula solo la primera vez que se pide y queda guardado; así el modelo no
+              necesita hacer .permute().contiguous() (una copia completa) en cada lote
+        """
+        return self.X.permute(0, 2, 1).contiguous()
+    
+    @classmethod
+    def from_arrays(cls, pm25, no2, seq_length=10):
+        """
+        CONSTRUCTOR ALTERNATIVO: Crea el dataset directamente desde los arrays de PM2.5 y NO2
+        PARÁMETROS: pm25, no2 (arrays de igual largo), seq_length (días de historial)
+        """
+        return cls(cls._stack_features(pm25, no2), seq_length)
+    
+    @staticmethod
+    def _stack_features(pm25, no2):
+        """
+        MÉTODO: Junta PM2.5 y NO2 en un array (días, N_FEATURES) float32 con una sola copia
+        """
+        arr = np.empty((len(pm25), N_FEATURES), dtype=np.float32)
+        arr[:, 0] = pm25               # Columna 0 = PM2.5
+        arr[:, 1] = no2                # Columna 1 = NO2
+        return arr
+    
+    def inverse_transform(self, values, column=0):
+        """
+        MÉTODO: Convierte valores normalizados de vuelta a su unidad original (μg/m³)
+        PARÁMETROS: values (número o array normalizado), column (0 = PM2.5, 1 = NO2)
+        RETORNA: float si la entrada es escalar, np.ndarray si es un array
+        """
+        original = np.asarray(values) * self.std[column] + self.mean[column]  # valor_real = normalizado × desviación + media
+        if np.isscalar(values):        # Un número entra, un float de Python sale (serializable a JSON)
+            return float(original)
+        return original
     
     def __len__(self):
         """
@@ -378,32 +617,41 @@ class AirQualityDataset(Dataset):
         PARÁMETRO: idx (índice del ejemplo que se quiere)
         RETORNA: X (historial), y (valor a predecir)
         """
-        X = self.data[idx:idx+self.seq_length]     # Historial de seq_length días
-        y = self.data[idx+self.seq_length][0]      # PM2.5 del día siguiente (columna 0)
-        return torch.FloatTensor(X), torch.FloatTensor([y])  # Convierte a tensores de PyTorch
+        return self.X[idx], self.y[idx]            # Historial de seq_length días y PM2.5 del día siguiente
+
+def get_city_by_id(choice):
+    """
+    FUNCIÓN: Obtiene una ciudad por su clave ("1", "2", ...) sin pedir nada al usuario
+    PROPÓSITO: Uso programático (backend/API); nunca bloquea esperando input()
+    RETORNA: City con la información de la ciudad
+    ERRORES: ValueError si la clave no existe
+    """
+    try:
+        return CITIES[str(choice).strip()]
+    except KeyError:
+        raise ValueError(f"Ciudad inválida: {choice!r}. Elige entre 1 y {len(CITIES)}") from None
 
-def select_city():
+def select_city_interactive():
     """
     FUNCIÓN: Permite al usuario seleccionar una ciudad del menú
-    PROPÓSITO: Interfaz de usuario para elegir qué ciudad analizar
-    RETORNA: Diccionario con información de la ciudad seleccionada
+    PROPÓSITO: Interfaz de usuario (consola) para elegir qué ciudad analizar;
+               el código no interactivo debe usar get_city_by_id()
+    RETORNA: City con la información de la ciudad seleccionada
     """
     print("\n🌍 CIUDADES DISPONIBLES:")
     print("-" * 30)
-    for key, city in CITIES.items():   # Recorre todas las ciudades disponibles
-        print(f"{key}. {city['name']}") # Muestra: "1. Ciudad de México"
+    print(CITY_MENU)                   # Muestra: "1. Ciudad de México", ... en una sola escritura
     
     while True:                        # Bucle infinito hasta que el usuario elija bien
         try:                          # Intenta leer la entrada del usuario
-            choice = input(f"\n🏙️  Elige una ciudad (1-{len(CITIES)}): ").strip()  # Pide selección
-            if choice in CITIES:       # Si la opción existe en el diccionario
-                selected_city = CITIES[choice]  # Obtiene la información completa
-                print(f"✅ Has seleccionado: {selected_city['name']}")
-                return selected_city   # Devuelve la ciudad seleccionada
-            else:                     # Si la opción no es válida
-                print(f"❌ Opción inválida. Elige entre 1 y {len(CITIES)}")
+            choice = input(f"\n🏙️  Elige una ciudad (1-{len(CITIES)}): ")  # Pide selección
+            selected_city = get_city_by_id(choice)  # Valida y obtiene la información completa
+            print(f"✅ Has seleccionado: {selected_city.name}")
+            return selected_city       # Devuelve la ciudad seleccionada
+        except ValueError:            # Si la opción no es válida
+            print(f"❌ Opción inválida. Elige entre 1 y {len(CITIES)}")
         except KeyboardInterrupt:     # Si el usuario presiona Ctrl+C
             print("\n👋 ¡Hasta luego!")
             exit()                    # Termina el programa
         except Exception as e:        # Cualquier otro error
-            print(f"❌ Error: {e}")
\ No newline at end of file
+            print(f"❌ Error: {e}")
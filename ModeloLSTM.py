@@ -6,11 +6,11 @@
 # IMPORTACIONES DE MACHINE LEARNING
 import torch                           # Framework principal de machine learning
 import torch.nn as nn                  # Módulo de redes neuronales (capas, funciones)
-from torch.utils.data import DataLoader, random_split  # Para cargar y dividir datos
-import numpy as np                     # Para operaciones matemáticas
+from torch.utils.data import Subset    # Subconjuntos devueltos por random_split
+import threading                       # Para proteger los buffers estáticos del CUDA Graph
 
 # IMPORTAR CONFIGURACIÓN DESDE NUESTRO SIMULADOR
-from AirVisualSimulator import SEQ_LENGTH, N_FEATURES, SCALER  # Parámetros globales del sistema
+from AirVisualSimulator import SEQ_LENGTH, N_FEATURES  # Parámetros globales del sistema
 
 # ========================================
 # CONFIGURACIÓN DEL MODELO LSTM
@@ -23,10 +23,18 @@ LEARNING_RATE = 0.001                  # Velocidad de aprendizaje (qué tan ráp
 N_EPOCHS = 30                          # Ciclos completos de entrenamiento
 BATCH_SIZE = 32                        # Ejemplos procesados simultáneamente
 DROPOUT_RATE = 0.2                     # Porcentaje de neuronas "apagadas" para evitar sobreajuste
+WARMUP_RUNS = 3                        # Pasadas de calentamiento del modelo TorchScript antes de servir
 
 # CONFIGURAR DISPOSITIVO DE CÓMPUTO
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")  # GPU si está disponible, sino CPU
 print(f"Usando dispositivo: {DEVICE}")  # Informa al usuario qué está usando
+USE_AMP = DEVICE.type == "cuda"        # Precisión mixta (float16) al entrenar solo en GPU; en CPU se entrena en float32
+
+# AJUSTES DE cuDNN/TF32 (solo GPU): las formas (lote, 10, 2) son fijas, el autotuner elige el kernel LSTM más rápido una vez
+if DEVICE.type == "cuda":
+    torch.backends.cudnn.benchmark = True          # Probar algoritmos cuDNN y recordar el mejor por forma
+    torch.backends.cudnn.allow_tf32 = True         # TF32 en convoluciones/RNN de cuDNN (Ampere+)
+    torch.backends.cuda.matmul.allow_tf32 = True   # TF32 en multiplicaciones de matrices
 
 class AirQualityPredictor(nn.Module):
     """
@@ -52,10 +60,13 @@ class AirQualityPredictor(nn.Module):
             num_layers=num_layers,         # Profundidad: 2 capas apiladas
             batch_first=True,              # Formato: (batch, secuencia, características)
             dropout=dropout_rate           # Dropout: apaga 20% de neuronas aleatoriamente
-        ).to(DEVICE)                       # Mover a GPU/CPU
+        )
         
         # CREAR CAPA DE SALIDA (DENSA/LINEAL)
-        self.fc = nn.Linear(hidden_dim, output_dim).to(DEVICE)  # 64 neuronas → 1 salida (PM2.5)
+        self.fc = nn.Linear(hidden_dim, output_dim)  # 64 neuronas → 1 salida (PM2.5)
+        
+        # MOVER TODO EL MODELO A GPU/CPU DE UNA VEZ
+        self.to(DEVICE)
 
     def forward(self, x):
         """
@@ -63,27 +74,143 @@ class AirQualityPredictor(nn.Module):
         PARÁMETRO: x (secuencias de entrada de 10 días)
         RETORNA: Predicción de PM2.5 para el día siguiente
         """
-        # INICIALIZAR ESTADOS OCULTOS DEL LSTM (memoria inicial = zeros)
-        h0 = torch.zeros(self.num_layers, x.size(0), self.hidden_dim).to(DEVICE)  # Estado oculto inicial
-        c0 = torch.zeros(self.num_layers, x.size(0), self.hidden_dim).to(DEVICE)  # Estado de celda inicial
-        
-        # PASAR DATOS POR LSTM
-        out, _ = self.lstm(x, (h0, c0))    # LSTM procesa secuencia completa, devuelve salidas de todos los pasos
+        # PASAR DATOS POR LSTM (sin estado explícito: nn.LSTM inicia memoria en ceros)
+        out, _ = self.lstm(x)              # LSTM procesa secuencia completa, devuelve salidas de todos los pasos
         
         # USAR SOLO LA ÚLTIMA SALIDA DEL LSTM (último día de la secuencia)
         out = self.fc(out[:, -1, :])       # Capa lineal: 64 dimensiones → 1 predicción
         
         return out                         # Devuelve predicción de PM2.5
 
+class DeviceBatchLoader:
+    """
+    CLASE: Reemplazo ligero de DataLoader para datasets pequeños que caben en el dispositivo
+    PROPÓSITO: Copiar X/y a GPU/CPU una sola vez y formar lotes por indexación,
+               sin procesos, collate ni copias por lote
+    USO: Igual que un DataLoader en train_model/evaluate_model (iterable de (X, y) y .dataset)
+    """
+    def __init__(self, dataset, batch_size, shuffle=False):
+        """
+        CONSTRUCTOR: Materializa las ventanas del dataset en el dispositivo
+        PARÁMETROS: dataset (AirQualityDataset o Subset de random_split),
+                    batch_size (ejemplos por lote), shuffle (mezclar en cada época)
+        """
+        if isinstance(dataset, Subset):    # random_split: tomar solo los índices del subconjunto
+            indices = torch.as_tensor(dataset.indices)
+            self.X = dataset.dataset.X[indices].to(DEVICE)
+            self.y = dataset.dataset.y[indices].to(DEVICE)
+        else:
+            self.X = dataset.X.to(DEVICE)
+            self.y = dataset.y.to(DEVICE)
+        self.dataset = dataset             # Para len(loader.dataset), como en DataLoader
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+    
+    def __len__(self):
+        """
+        MÉTODO: Número de lotes por época
+        """
+        return (self.X.size(0) + self.batch_size - 1) // self.batch_size
+    
+    def __iter__(self):
+        """
+        MÉTODO: Genera los lotes (X, y) de una época
+        """
+        n = self.X.size(0)
+        if self.shuffle:                   # Nueva permutación por época, generada en el dispositivo
+            order = torch.randperm(n, device=DEVICE)
+            for start in range(0, n, self.batch_size):
+                batch = order[start:start + self.batch_size]
+                yield self.X[batch], self.y[batch]
+        else:                              # Orden fijo: lotes como vistas, sin copiar
+            for start in range(0, n, self.batch_size):
+                yield self.X[start:start + self.batch_size], self.y[start:start + self.batch_size]
+
+def script_for_inference(model):
+    """
+    FUNCIÓN: Compila el modelo con TorchScript para predicciones rápidas
+    PROPÓSITO: Evitar el intérprete de Python en cada forward de inferencia
+    PARÁMETROS: model (AirQualityPredictor ya entrenado)
+    RETORNA: Módulo TorchScript congelado y optimizado (solo inferencia);
+             en GPU, envuelto en un CUDAGraphPredictor
+    """
+    scripted = torch.jit.script(model.eval())  # Compilar forward a TorchScript
+    scripted = torch.jit.optimize_for_inference(scripted)  # Congelar pesos y fusionar operaciones
+    
+    # CALENTAMIENTO: pasadas con la forma real para que el JIT termine de especializar el grafo
+    example = torch.zeros(1, SEQ_LENGTH, N_FEATURES, device=DEVICE)
+    with torch.no_grad():
+        for _ in range(WARMUP_RUNS):
+            scripted(example)
+    
+    # EN GPU: capturar el forward en un CUDA Graph (una sola reproducción en lugar de un kernel por operación)
+    if DEVICE.type == "cuda":
+        try:
+            return CUDAGraphPredictor(scripted)
+        except RuntimeError as e:
+            print(f"CUDA Graph no disponible, usando TorchScript: {e}")
+    
+    return scripted                        # Pesos congelados: volver a compilar tras re-entrenar
+
+class CUDAGraphPredictor:
+    """
+    CLASE: Forward de inferencia capturado en un CUDA Graph para una secuencia (1, 10, 2)
+    PROPÓSITO: Reproducir todos los kernels del modelo con una sola llamada en GPU
+    USO: Se llama igual que el modelo; copia la entrada al buffer estático y reproduce el grafo
+    """
+    def __init__(self, model):
+        """
+        CONSTRUCTOR: Calienta el modelo en un stream aparte y captura el grafo
+        PARÁMETRO: model (módulo de inferencia en DEVICE, en modo evaluación)
+        """
+        self.model = model                 # Se usa directamente para lotes de otro tamaño
+        self.static_input = torch.zeros(1, SEQ_LENGTH, N_FEATURES, device=DEVICE)  # Entrada fija del grafo
+        self._lock = threading.Lock()      # Un solo hilo por reproducción (buffers compartidos)
+        
+        # CALENTAMIENTO EN STREAM LATERAL (requisito antes de capturar)
+        stream = torch.cuda.Stream()
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(stream), torch.no_grad():
+            for _ in range(3):
+                model(self.static_input)
+        torch.cuda.current_stream().wait_stream(stream)
+        
+        # CAPTURA DEL GRAFO
+        self.graph = torch.cuda.CUDAGraph()
+        with torch.no_grad(), torch.cuda.graph(self.graph):
+            self.static_output = model(self.static_input)  # Salida fija del grafo (1, 1)
+    
+    def eval(self):
+        """
+        MÉTODO: Compatibilidad con model.eval() (el grafo ya es solo de inferencia)
+        """
+        return self
+    
+    def __call__(self, x):
+        """
+        MÉTODO: Ejecuta el grafo capturado sobre una secuencia
+        PARÁMETRO: x (tensor (1, SEQ_LENGTH, N_FEATURES); otras formas van al modelo sin grafo)
+        RETORNA: Copia de la salida (1, 1), independiente de la siguiente reproducción
+        """
+        if x.shape != self.static_input.shape:
+            return self.model(x)           # El grafo solo sirve para la forma capturada
+        with self._lock:
+            self.static_input.copy_(x)     # Cargar entrada en el buffer estático
+            self.graph.replay()            # Reproducir todos los kernels capturados
+            return self.static_output.clone()
+
 def train_model(model, train_loader, val_loader):
     """
     FUNCIÓN: Entrena el modelo LSTM con los datos
     PROPÓSITO: Enseñar al modelo a reconocer patrones temporales
-    PARÁMETROS: model (modelo a entrenar), train_loader (datos entrenamiento), val_loader (datos validación)
+    PARÁMETROS: model (modelo a entrenar), train_loader (datos entrenamiento), val_loader (datos validación);
+                los cargadores son DeviceBatchLoader: los lotes ya llegan en DEVICE
     """
     # CONFIGURAR ENTRENAMIENTO
     criterion = nn.MSELoss()               # Función de pérdida: Error Cuadrático Medio
-    optimizer = torch.optim.Adam(model.parameters(), lr=LEARNING_RATE)  # Optimizador Adam
+    optimizer = torch.optim.Adam(model.parameters(), lr=LEARNING_RATE,
+                                 fused=DEVICE.type == "cuda")  # Optimizador Adam (en GPU: un solo kernel para todos los parámetros)
+    scaler = torch.amp.GradScaler("cuda", enabled=USE_AMP)  # Escala la pérdida para que los gradientes float16 no se anulen
     
     history = {'train_loss': [], 'val_loss': []}  # Historial de pérdidas para graficar
     
@@ -92,26 +219,26 @@ def train_model(model, train_loader, val_loader):
     # CICLO PRINCIPAL DE ENTRENAMIENTO
     for epoch in range(N_EPOCHS):         # Repite 30 veces (épocas)
         model.train()                      # Modo entrenamiento (activa dropout)
-        train_loss = 0                     # Acumulador de pérdida de entrenamiento
+        train_loss_sum = torch.zeros((), device=DEVICE)  # Acumulador en el dispositivo (sin sincronizar por lote)
         
         # PROCESAR CADA LOTE DE DATOS
-        for X_batch, y_batch in train_loader:  # X_batch = secuencias, y_batch = valores objetivo
-            X_batch, y_batch = X_batch.to(DEVICE), y_batch.to(DEVICE)  # Mover a GPU/CPU
-            
-            # PASO HACIA ADELANTE (FORWARD)
-            y_pred = model(X_batch)        # Obtener predicciones del modelo
-            loss = criterion(y_pred, y_batch)  # Calcular error entre predicción y realidad
+        for X_batch, y_batch in train_loader:  # X_batch = secuencias, y_batch = valores objetivo (ya en DEVICE)
+            # PASO HACIA ADELANTE (FORWARD) - en float16 si USE_AMP
+            with torch.autocast(device_type=DEVICE.type, dtype=torch.float16, enabled=USE_AMP):
+                y_pred = model(X_batch)    # Obtener predicciones del modelo
+                loss = criterion(y_pred, y_batch)  # Calcular error entre predicción y realidad
             
             # PASO HACIA ATRÁS (BACKWARD) - APRENDIZAJE
             optimizer.zero_grad()          # Limpiar gradientes anteriores
-            loss.backward()                # Calcular gradientes (derivadas)
-            optimizer.step()               # Actualizar pesos del modelo
+            scaler.scale(loss).backward()  # Calcular gradientes (derivadas) sobre la pérdida escalada
+            scaler.step(optimizer)         # Actualizar pesos del modelo (omite el paso si hay inf/NaN)
+            scaler.update()                # Ajustar el factor de escala para el siguiente lote
             
             # ACUMULAR PÉRDIDA
-            train_loss += loss.item() * X_batch.size(0)  # Sumar pérdida ponderada por tamaño del lote
+            train_loss_sum += loss.detach() * X_batch.size(0)  # Sumar pérdida ponderada por tamaño del lote
             
         # CALCULAR PÉRDIDA PROMEDIO DE LA ÉPOCA
-        train_loss /= len(train_loader.dataset)  # Dividir por número total de ejemplos
+        train_loss = train_loss_sum.item() / len(train_loader.dataset)  # Un solo .item() por época
         
         # EVALUAR EN DATOS DE VALIDACIÓN
         val_loss = evaluate_model(model, val_loader, criterion)  # Probar modelo en datos no vistos
@@ -133,16 +260,15 @@ def evaluate_model(model, data_loader, criterion):
     RETORNA: Pérdida promedio en el conjunto de datos
     """
     model.eval()                           # Modo evaluación (desactiva dropout)
-    total_loss = 0                         # Acumulador de pérdida total
+    total_loss = torch.zeros((), device=DEVICE)  # Acumulador de pérdida total en el dispositivo
     
     with torch.no_grad():                  # No calcular gradientes (ahorra memoria y tiempo)
         for X_batch, y_batch in data_loader:  # Procesar cada lote
-            X_batch, y_batch = X_batch.to(DEVICE), y_batch.to(DEVICE)  # Mover a dispositivo
             y_pred = model(X_batch)        # Obtener predicciones
             loss = criterion(y_pred, y_batch)  # Calcular error
-            total_loss += loss.item() * X_batch.size(0)  # Acumular pérdida
+            total_loss += loss * X_batch.size(0)  # Acumular pérdida (sin .item() por lote)
             
-    return total_loss / len(data_loader.dataset)  # Devolver pérdida promedio
+    return total_loss.item() / len(data_loader.dataset)  # Devolver pérdida promedio
 
 def get_predictions_and_targets(model, data_loader):
     """
@@ -151,46 +277,53 @@ def get_predictions_and_targets(model, data_loader):
     RETORNA: Arrays de predicciones y valores reales
     """
     model.eval()                           # Modo evaluación
-    predictions = []                       # Lista para predicciones
-    targets = []                           # Lista para valores reales
+    total = len(data_loader.dataset)       # Número total de ejemplos (tamaño final conocido)
+    predictions = torch.empty(total, device=DEVICE)  # Predicciones preasignadas en el dispositivo
+    targets = torch.empty(total, device=DEVICE)      # Valores reales preasignados en el dispositivo
     
+    start = 0                              # Posición donde escribir el siguiente lote
     with torch.no_grad():                  # Sin gradientes
         for X_batch, y_batch in data_loader:  # Procesar cada lote
-            X_batch, y_batch = X_batch.to(DEVICE), y_batch.to(DEVICE)  # Mover a dispositivo
-            y_pred = model(X_batch)        # Obtener predicciones
-            
-            # CONVERTIR A LISTAS DE PYTHON
-            predictions.extend(y_pred.cpu().numpy().flatten())  # Agregar predicciones
-            targets.extend(y_batch.cpu().numpy().flatten())     # Agregar valores reales
+            end = start + X_batch.size(0)
+            predictions[start:end] = model(X_batch).flatten()  # Escribir lote en su tramo (sin sincronizar)
+            targets[start:end] = y_batch.flatten()
+            start = end
             
-    return np.array(predictions), np.array(targets)  # Convertir a arrays de NumPy
+    # UNA SOLA COPIA AL FINAL: dispositivo → CPU → NumPy
+    return predictions.cpu().numpy(), targets.cpu().numpy()
 
 
-def make_single_prediction(model, sequence):
+def make_single_prediction(model, sequence, dataset):
     """
     FUNCIÓN: Realiza una predicción para un solo día usando secuencia de 10 días
     PROPÓSITO: Predecir PM2.5 de mañana basado en últimos 10 días
-    PARÁMETRO: sequence (array de 10 días × 2 características)
+    PARÁMETROS: sequence (tensor o array float32 de 10 días × 2 características),
+                dataset (AirQualityDataset que normalizó la secuencia)
     RETORNA: Valor de PM2.5 predicho en μg/m³ (desnormalizado)
     """
     model.eval()                           # Modo evaluación
-    with torch.no_grad():                  # Sin gradientes
+    with torch.inference_mode():           # Sin gradientes ni contadores de versión/vistas de autograd
         # PASO 1: PREPARAR DATOS
-        sequence_tensor = torch.tensor(sequence, dtype=torch.float32).unsqueeze(0).to(DEVICE)
-        # ↑ Convierte array → tensor, agrega dimensión de lote, mueve a dispositivo
-        
-        # PASO 2: OBTENER PREDICCIÓN (NORMALIZADA 0-1)
-        prediction_scaled = model(sequence_tensor).cpu().numpy().flatten()[0]
-        # ↑ Pasa por modelo, mueve a CPU, convierte a array, toma primer elemento
-        
-        # PASO 3: DESNORMALIZAR LA PREDICCIÓN (convertir 0-1 → μg/m³)
-        from AirVisualSimulator import SCALER  # Importar objeto normalizador
+        sequence_tensor = torch.as_tensor(sequence, dtype=torch.float32).unsqueeze(0).to(DEVICE, non_blocking=True)
+        # ↑ Vista sin copia si ya es float32 (tensor o NumPy), agrega dimensión de lote, mueve a dispositivo
         
-        # OBTENER PARÁMETROS DE NORMALIZACIÓN
-        mean = SCALER.mean_[0]             # Media usada para normalizar PM2.5 (columna 0)
-        scale = SCALER.scale_[0]           # Escala usada para normalizar PM2.5
-        
-        # FÓRMULA DE DESNORMALIZACIÓN: valor_real = (valor_normalizado × escala) + media
-        predicted_unscaled = (prediction_scaled * scale) + mean
+        # PASO 2: PREDECIR Y DESNORMALIZAR EN EL DISPOSITIVO (convertir → μg/m³)
+        predicted_unscaled = (model(sequence_tensor)[0, 0] * dataset.pm25_scale + dataset.pm25_mean).item()
+        # ↑ Pasa por modelo, desnormaliza sin salir del dispositivo y copia un único float a Python
         
         return predicted_unscaled          # Devuelve predicción en μg/m³
+
+def make_batch_predictions(model, sequences, datasets):
+    """
+    FUNCIÓN: Predice el día siguiente para varias series en una sola pasada del modelo
+    PROPÓSITO: Un único forward con lote (B, 10, 2) en lugar de B llamadas a make_single_prediction
+    PARÁMETROS: sequences (lista de tensores o arrays float32 de 10 días × 2 características),
+                datasets (AirQualityDataset que normalizó cada secuencia, mismo orden)
+    RETORNA: Lista de valores de PM2.5 predichos en μg/m³ (desnormalizados), mismo orden
+    """
+    model.eval()                           # Modo evaluación
+    with torch.inference_mode():
+        batch = torch.stack([torch.as_tensor(seq, dtype=torch.float32) for seq in sequences]).to(DEVICE, non_blocking=True)
+        scale = torch.tensor([d.pm25_scale for d in datasets], device=DEVICE)  # Desviación de PM2.5 por serie
+        mean = torch.tensor([d.pm25_mean for d in datasets], device=DEVICE)    # Media de PM2.5 por serie
+        return (model(batch)[:, 0] * scale + mean).tolist()  # Una sola copia al host para todo el lote
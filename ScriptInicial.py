@@ -13,15 +13,14 @@ sys.path.insert(0, current_dir)       # Agrega directorio actual al path de Pyth
 
 # IMPORTACIONES DE MACHINE LEARNING
 import torch                           # Framework principal de machine learning
-from torch.utils.data import DataLoader, random_split  # Para cargar datos y dividir en train/test
+from torch.utils.data import random_split  # Para dividir datos en train/test
 import numpy as np                     # Para operaciones matemáticas
-import matplotlib.pyplot as plt        # Para crear gráficos (opcional)
 from datetime import datetime, timedelta  # Para manejo de fechas
 
 # IMPORTACIONES DE NUESTRO PROYECTO
-from AirVisualSimulator import generate_airvisual_data, AirQualityDataset, SEQ_LENGTH, N_FEATURES, SCALER, select_city
+from AirVisualSimulator import generate_airvisual_data, AirQualityDataset, SEQ_LENGTH, N_FEATURES, select_city_interactive
 # ↑ Funciones para obtener datos y crear dataset
-from ModeloLSTM import AirQualityPredictor, train_model, make_single_prediction, HIDDEN_DIM, NUM_LAYERS, OUTPUT_DIM, BATCH_SIZE, DROPOUT_RATE
+from ModeloLSTM import AirQualityPredictor, train_model, make_single_prediction, HIDDEN_DIM, NUM_LAYERS, OUTPUT_DIM, BATCH_SIZE, DROPOUT_RATE, DEVICE, DeviceBatchLoader
 # ↑ Modelo LSTM y funciones de entrenamiento
 
 # CONFIGURACIÓN GLOBAL
@@ -33,6 +32,8 @@ def plot_training_history(history):
     PROPÓSITO: Visualizar si el modelo está aprendiendo correctamente
     PARÁMETRO: history (diccionario con pérdidas de entrenamiento y validación)
     """
+    import matplotlib.pyplot as plt    # Importación diferida: matplotlib solo se carga si se grafica
+    
     plt.figure(figsize=(10, 5))        # Crea figura de 10x5 pulgadas
     plt.plot(history['train_loss'], label='Pérdida Entrenamiento (MSE)', color='skyblue')  # Línea azul para entrenamiento
     plt.plot(history['val_loss'], label='Pérdida Validación (MSE)', color='tomato')        # Línea roja para validación
@@ -43,22 +44,18 @@ def plot_training_history(history):
     plt.grid(True)                     # Agrega cuadrícula para facilitar lectura
     plt.show()                         # Muestra el gráfico en pantalla
 
-def plot_predictions(targets_scaled, predictions_scaled, title="Predicciones vs. Reales (Conjunto de Validación)"):
+def plot_predictions(targets_scaled, predictions_scaled, dataset, title="Predicciones vs. Reales (Conjunto de Validación)"):
     """
     FUNCIÓN: Crea gráfico comparando predicciones del modelo vs valores reales
     PROPÓSITO: Verificar visualmente qué tan bien predice el modelo
-    PARÁMETROS: targets_scaled (valores reales), predictions_scaled (predicciones del modelo)
+    PARÁMETROS: targets_scaled (valores reales), predictions_scaled (predicciones del modelo),
+                dataset (AirQualityDataset que normalizó los datos)
     """
-    # IMPORTAR SCALER PARA DESNORMALIZAR
-    from AirVisualSimulator import SCALER  # Importa el objeto que normalizó los datos
-    
-    # DESNORMALIZAR DATOS (convertir de 0-1 de vuelta a μg/m³)
-    mean_pm25 = SCALER.mean_[1]        # Media usada para normalizar PM2.5 (columna 1)
-    scale_pm25 = SCALER.scale_[1]      # Escala usada para normalizar PM2.5
+    import matplotlib.pyplot as plt    # Importación diferida: matplotlib solo se carga si se grafica
     
-    # FÓRMULA DE DESNORMALIZACIÓN: valor_original = (valor_normalizado * escala) + media
-    targets = (targets_scaled * scale_pm25) + mean_pm25      # Valores reales desnormalizados
-    predictions = (predictions_scaled * scale_pm25) + mean_pm25  # Predicciones desnormalizadas
+    # DESNORMALIZAR DATOS (convertir de vuelta a μg/m³ con la media/desviación de PM2.5, columna 0)
+    targets = dataset.inverse_transform(targets_scaled, column=0)          # Valores reales desnormalizados
+    predictions = dataset.inverse_transform(predictions_scaled, column=0)  # Predicciones desnormalizadas
     
     # CREAR GRÁFICO
     plt.figure(figsize=(12, 6))        # Figura de 12x6 pulgadas
@@ -93,7 +90,7 @@ def main():
     print("="*50)
     
     # PASO 1: SELECCIÓN DE CIUDAD
-    selected_city = select_city()      # Llama función que muestra menú y obtiene elección del usuario
+    selected_city = select_city_interactive()  # Llama función que muestra menú y obtiene elección del usuario
     
     # PASO 2: OBTENCIÓN DE DATOS
     print("\n📊 Obteniendo datos...")  # Muestra mensaje al usuario
@@ -107,16 +104,16 @@ def main():
         return                         # Termina la función (sale del programa)
     
     # PASO 3: PREPARAR DATOS PARA MACHINE LEARNING
-    full_dataset = AirQualityDataset(raw_data_scaled, SEQ_LENGTH)  # Convierte DataFrame a Dataset de PyTorch
+    full_dataset = AirQualityDataset(raw_data_scaled, SEQ_LENGTH)  # Convierte la serie temporal a Dataset de PyTorch
     
     # DIVIDIR DATOS: 80% entrenamiento, 20% validación
     train_size = int(0.8 * len(full_dataset))  # 80% de los datos para entrenar
     val_size = len(full_dataset) - train_size  # 20% restante para validar
     train_dataset, val_dataset = random_split(full_dataset, [train_size, val_size])  # División aleatoria
 
-    # CREAR CARGADORES DE DATOS (DataLoaders)
-    train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True)   # Entrenamiento: mezcla datos
-    val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False)      # Validación: orden fijo
+    # CREAR CARGADORES DE DATOS (lotes directamente en GPU/CPU, sin DataLoader)
+    train_loader = DeviceBatchLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True)   # Entrenamiento: mezcla datos
+    val_loader = DeviceBatchLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False)      # Validación: orden fijo
 
     # MOSTRAR INFORMACIÓN DE DATOS
     print(f"📈 Entrenamiento: {len(train_dataset)} secuencias")  # Cuántas secuencias para entrenar
@@ -127,7 +124,7 @@ def main():
     model = AirQualityPredictor(N_FEATURES, HIDDEN_DIM, NUM_LAYERS, OUTPUT_DIM, DROPOUT_RATE)  # Crea modelo LSTM
     
     try:                               # Intenta cargar modelo ya entrenado
-        model.load_state_dict(torch.load(MODEL_PATH))  # Carga pesos del archivo .pth
+        model.load_state_dict(torch.load(MODEL_PATH, map_location=DEVICE, weights_only=True))  # Carga pesos directo al dispositivo
         print("✅ Modelo cargado desde archivo")  # Confirma carga exitosa
     except FileNotFoundError:          # Si no existe archivo del modelo
         print("🔄 Entrenando nuevo modelo...")  # Informa que va a entrenar
@@ -138,26 +135,18 @@ def main():
         print("💾 Modelo guardado")            # Confirma guardado
 
     # PASO 5: REALIZAR PREDICCIÓN PARA MAÑANA
-    print(f"\n🔮 PREDICCIÓN PARA {selected_city['name'].upper()} - {tomorrow}")
+    print(f"\n🔮 PREDICCIÓN PARA {selected_city.name.upper()} - {tomorrow}")
     print("-"*50)
     
     # OBTENER ÚLTIMA SECUENCIA DE DATOS (para predecir mañana)
-    last_sequence_data, _ = full_dataset[len(full_dataset)-1]  # Últimos 10 días del dataset
-    prediction_sequence = last_sequence_data.cpu().numpy()    # Convierte a array de NumPy
+    prediction_sequence, _ = full_dataset[len(full_dataset)-1]  # Últimos 10 días del dataset (tensor float32)
     
     # OBTENER VALOR REAL DEL ÚLTIMO DÍA (para referencia)
-    from AirVisualSimulator import SCALER  # Importa objeto normalizador
-    if SCALER is not None:             # Si el normalizador existe
-        # DESNORMALIZAR EL ÚLTIMO VALOR
-        last_pm25_scaled = full_dataset.data[-1][1].item()  # PM2.5 del último día (columna 1, normalizado)
-        mean_pm25 = SCALER.mean_[1]    # Media usada para normalizar
-        scale_pm25 = SCALER.scale_[1]  # Escala usada para normalizar
-        real_last_value = (last_pm25_scaled * scale_pm25) + mean_pm25  # Desnormaliza: valor real
-    else:                              # Si no hay normalizador
-        real_last_value = 25.0         # Valor por defecto
+    last_pm25_scaled = full_dataset.data[-1][0].item()  # PM2.5 del último día (columna 0, normalizado)
+    real_last_value = full_dataset.inverse_transform(last_pm25_scaled)  # Desnormaliza: valor real
     
     # HACER PREDICCIÓN PARA MAÑANA
-    predicted_pm25 = make_single_prediction(model, prediction_sequence)  # Llama al modelo con últimos 10 días
+    predicted_pm25 = make_single_prediction(model, prediction_sequence, full_dataset)  # Llama al modelo con últimos 10 días
     
     # MOSTRAR RESULTADOS AL USUARIO
     print(f"📊 PM2.5 actual (hoy): {real_last_value:.1f} μg/m³")    # Valor de hoy (.1f = 1 decimal)
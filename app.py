@@ -1,10 +1,17 @@
 from flask import Flask, jsonify, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import torch
 import numpy as np
 from datetime import datetime, timedelta
+import copy
+from collections import OrderedDict
+import functools
 import os
 import sys
+import threading
+import time
+import unicodedata
 
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -13,11 +20,12 @@ sys.path.insert(0, current_dir)
 
 from AirVisualSimulator import (
     generate_airvisual_data, 
+    generate_airvisual_data_batch,
     AirQualityDataset, 
     SEQ_LENGTH, 
     N_FEATURES, 
-    SCALER, 
     CITIES,
+    get_city_by_id,
     aqi_to_pm25,
     get_aqi_quality_level
 )
@@ -25,21 +33,153 @@ from ModeloLSTM import (
     AirQualityPredictor, 
     train_model, 
     make_single_prediction, 
+    make_batch_predictions,
+    script_for_inference,
     HIDDEN_DIM, 
     NUM_LAYERS, 
     OUTPUT_DIM, 
     BATCH_SIZE, 
     DROPOUT_RATE,
-    DEVICE
+    DEVICE,
+    DeviceBatchLoader
 )
 
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """
+    CLASS: Flask JSON provider backed by orjson (C serializer)
+    PURPOSE: Serialize every jsonify() response without the stdlib json module;
+             honours the provider's sort_keys and indent settings
+    """
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
-CORS(app)  
+if orjson is not None:
+    app.json = ORJSONProvider(app)
+app.json.sort_keys = False  # Keys in insertion order: no sorting pass on every response
+app.json.compact = True  # Never pretty-print, not even in debug mode
+# Solo /api/*; "*" sin eco del Origin (sin Vary: Origin) y preflight cacheado por el navegador un día
+CORS(app, resources={r"/api/*": {"origins": "*"}}, methods=["GET", "POST"], allow_headers=["Content-Type"],
+     send_wildcard=True, max_age=86400)
 
 MODEL_PATH = 'air_quality_predictor_model.pth'
 model = None  
-cached_data = {}  
+inference_model = None  # TorchScript copy of `model` used for predictions
+model_trained = False  # True once `model` holds trained weights (loaded or trained in this process)
+model_version = 0  # Incremented each time the in-memory model is replaced by a retrained one
+model_handle = (0, None)  # (model_version, inference model) published together: readers take one consistent snapshot
+model_lock = threading.RLock()  # Serializes model initialization and training between request threads
+cached_data = OrderedDict()  # cache key -> {'data', 'etag', 'timestamp'}, least recently used first
+cached_data_lock = threading.Lock()  # Protects reordering/eviction between request threads
+RESPONSE_CACHE_MAX = 128  # Maximum cached responses; the least recently used one is dropped beyond this
+RESPONSE_CACHE_TTL = 300  # Seconds a cached response is served (cache de 5 minutos)
+dataset_cache = {}  # city name -> {'data', 'dataset', 'timestamp', 'prediction': (model_version, PM2.5)}
+DATASET_CACHE_TTL = 1800  # Seconds a city's dataset is reused before regenerating it
+TRAIN_NUM_THREADS = torch.get_num_threads()  # PyTorch's default intra-op threads, captured before init_app() lowers it to 1
+weather_rng = np.random.default_rng()  # PCG64 generator for simulated weather (no global NumPy state)
+WEATHER_MEAN = np.array([22.0, 60.0, 15.0, 1013.0])  # temperature, humidity, wind_speed, pressure
+WEATHER_STD = np.array([8.0, 20.0, 5.0, 20.0])
+
+def normalize_city_name(name):
+    """
+    FUNCTION: Lookup key for a city name: accents removed, case-folded, single spaces
+    PURPOSE: "ciudad de mexico", "Ciudad de México" and " CIUDAD  DE MÉXICO" find the same city
+    """
+    ascii_name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(ascii_name.casefold().split())
+
+# Normalized display name / API city name -> City, built once so endpoints do a single dict lookup
+CITY_INDEX = {}
+for _city in CITIES.values():
+    CITY_INDEX.setdefault(normalize_city_name(_city.city), _city)
+for _city in CITIES.values():
+    CITY_INDEX[normalize_city_name(_city.name)] = _city  # Display names win over an API name that collides
+del _city
+
+# /api/cities never changes at runtime: serialize it once and serve the same bytes every time
+CITIES_RESPONSE_JSON = app.json.dumps({
+    'success': True,
+    'cities': [
+        {'id': key, 'name': city.name, 'city': city.city, 'state': city.state, 'country': city.country}
+        for key, city in CITIES.items()
+    ],
+    'total': len(CITIES)
+})
+
+_last_iso = ('', -1)  # (ISO string, epoch second it was built for)
+
+def iso_now():
+    """
+    FUNCTION: Current local time as an ISO-8601 string, cached per second
+    PURPOSE: Avoid rebuilding the same timestamp string for every response within a second
+    """
+    global _last_iso
+    second = int(time.time())
+    cached = _last_iso
+    if cached[1] != second:
+        cached = (datetime.fromtimestamp(second).isoformat(), second)
+        _last_iso = cached
+    return cached[0]
+
+def json_array(values):
+    """
+    FUNCTION: NumPy array in a form the active JSON provider can serialize
+    PURPOSE: orjson encodes numeric arrays straight from their buffer; only the stock provider needs a list
+    """
+    return values if orjson is not None else values.tolist()
+
+def cache_json_response(cache_key, response):
+    """
+    FUNCTION: Stores a JSON response body in cached_data together with its ETag
+    PURPOSE: Cache hits reuse the serialized bytes and clients can revalidate with If-None-Match
+    RETURNS: The response, tagged and conditional (304 if the client already has this body)
+    """
+    response.add_etag()
+    with cached_data_lock:
+        cached_data[cache_key] = {
+            'data': response.get_data(),
+            'etag': response.get_etag()[0],
+            'timestamp': time.monotonic()
+        }
+        cached_data.move_to_end(cache_key)
+        if len(cached_data) > RESPONSE_CACHE_MAX:
+            cached_data.popitem(last=False)
+    response.cache_control.max_age = RESPONSE_CACHE_TTL
+    return response.make_conditional(request)
+
+def cached_json_response(cache_key):
+    """
+    FUNCTION: Response for a cached_data entry stored by cache_json_response
+    RETURNS: 200 with the stored bytes, 304 with no body when If-None-Match matches the ETag,
+             or None if there is no fresh entry (younger than RESPONSE_CACHE_TTL)
+    """
+    with cached_data_lock:
+        entry = cached_data.get(cache_key)
+        # Edad completa en segundos (timedelta.seconds ignoraba los días y revivía entradas viejas)
+        age = time.monotonic() - entry['timestamp'] if entry is not None else RESPONSE_CACHE_TTL
+        if age >= RESPONSE_CACHE_TTL:
+            return None
+        cached_data.move_to_end(cache_key)  # Mark as recently used
+    response = app.response_class(entry['data'], mimetype='application/json')
+    response.set_etag(entry['etag'])
+    response.cache_control.max_age = int(RESPONSE_CACHE_TTL - age)
+    return response.make_conditional(request)
 
 def initialize_model():
     """
@@ -47,15 +187,19 @@ def initialize_model():
 
     PURPOSE: Prepare model for making predictions
     """
-    global model
+    global model, inference_model, model_trained, model_handle
     print("Initializing LSTM model...")
     
     try:
         model = AirQualityPredictor(N_FEATURES, HIDDEN_DIM, NUM_LAYERS, OUTPUT_DIM, DROPOUT_RATE)
         
         if os.path.exists(MODEL_PATH):
-            model.load_state_dict(torch.load(MODEL_PATH, map_location=DEVICE))
-            print("Model loaded successfully")
+            model.load_state_dict(torch.load(MODEL_PATH, map_location=DEVICE, weights_only=True))  # Solo tensores: sin unpickling arbitrario
+            warmup_start = time.perf_counter()
+            inference_model = script_for_inference(model)
+            model_handle = (model_version, inference_model)
+            model_trained = True  # Último: el camino rápido sin lock solo lo ve con model_handle ya publicado
+            print(f"Model loaded successfully (inference warm-up: {time.perf_counter() - warmup_start:.2f}s)")
         else:
             print("Model not found, it will be trained when needed")
 
@@ -64,32 +208,55 @@ def initialize_model():
         print(f"Error initializing model: {e}")
         return False
 
-def ensure_model_trained(city_data):
+def ensure_model_trained(full_dataset, force=False):
     """
     FUNCTION: Ensures the model is trained with city data
     PURPOSE: Train model if it does not exist or if necessary
+    PARAMETERS: full_dataset (the city's AirQualityDataset, as cached by cache_city_dataset),
+                force (retrain even if a trained model is already in memory)
     """
-    global model
+    global model, inference_model, model_trained, model_version, model_handle
     
-    if not os.path.exists(MODEL_PATH):
+    if model_trained and not force:
+        return True  # Camino rápido: el modelo ya está en memoria, sin tocar disco ni lock
+    
+    with model_lock:
+        # Respaldo si se sirvió `app` sin pasar por init_app(): cargar en la primera petición
+        if model is None and not initialize_model():
+            return False
+        
+        if model_trained and not force:
+            return True  # Otro hilo terminó de entrenar mientras esperábamos
+        
         print(" Training model with current data...")
         
         try:
-            from torch.utils.data import DataLoader, random_split
-            
-            full_dataset = AirQualityDataset(city_data, SEQ_LENGTH)
+            from torch.utils.data import random_split
             
             train_size = int(0.8 * len(full_dataset))
             val_size = len(full_dataset) - train_size
             train_dataset, val_dataset = random_split(full_dataset, [train_size, val_size])
             
-            train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True)
-            val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False)
+            train_loader = DeviceBatchLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True)
+            val_loader = DeviceBatchLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False)
             
-            train_model(model, train_loader, val_loader)
+            # Entrenar una copia: las peticiones en curso siguen usando el modelo actual hasta el cambio
+            new_model = copy.deepcopy(model)
+            inference_threads = torch.get_num_threads()
+            torch.set_num_threads(TRAIN_NUM_THREADS)  # Entrenar con todos los hilos; la inferencia usa 1
+            try:
+                train_model(new_model, train_loader, val_loader)
+            finally:
+                torch.set_num_threads(inference_threads)
+            new_inference_model = script_for_inference(new_model)
             
-            torch.save(model.state_dict(), MODEL_PATH)
-            print(" Model trained and saved")
+            model, inference_model = new_model, new_inference_model
+            model_version += 1
+            model_handle = (model_version, inference_model)  # Una sola asignación: nunca modelo nuevo con versión vieja
+            model_trained = True  # Último: el camino rápido sin lock solo lo ve con model_handle ya publicado
+            
+            torch.save(model.state_dict(), MODEL_PATH)  # Persistencia: solo se lee al arrancar
+            print(f" Model trained and saved (version {model_version})")
             
         except Exception as e:
             print(f" Error training model: {e}")
@@ -97,33 +264,86 @@ def ensure_model_trained(city_data):
     
     return True
 
-def predict_next_day_pm25(city_info):
+def get_city_dataset(city_info):
+    """
+    FUNCTION: Time series and normalized dataset for a city, cached for DATASET_CACHE_TTL seconds
+    PURPOSE: Avoid regenerating the series and rebuilding the dataset on every prediction
+    RETURNS: (city_data, dataset), or (None, None) if there is not enough data
+    """
+    entry = dataset_cache.get(city_info.name)
+    if entry and time.monotonic() - entry['timestamp'] < DATASET_CACHE_TTL:
+        return entry['data'], entry['dataset']
+    
+    return cache_city_dataset(city_info, generate_airvisual_data(city_info))
+
+def cache_city_dataset(city_info, city_data):
+    """
+    FUNCTION: Builds the normalized dataset for a city's series and stores it in dataset_cache
+    RETURNS: (city_data, dataset), or (None, None) if there is not enough data
+    """
+    if city_data is None or len(city_data) < SEQ_LENGTH + 10:
+        return None, None
+    
+    full_dataset = AirQualityDataset(city_data, SEQ_LENGTH)
+    dataset_cache[city_info.name] = {
+        'data': city_data,
+        'dataset': full_dataset,
+        'timestamp': time.monotonic()
+    }
+    return city_data, full_dataset
+
+def warm_up_predictions():
+    """
+    FUNCTION: Preloads every city's dataset and predicts all cities in one batched forward pass
+    PURPOSE: Keep data fetching, dataset construction and inference out of the first user requests
+    """
+    version, predictor = model_handle
+    if predictor is None:
+        return
+    
+    city_list = list(CITIES.values())
+    for city_info, city_data in zip(city_list, generate_airvisual_data_batch(city_list)):
+        cache_city_dataset(city_info, city_data)
+    
+    # Una sola pasada del modelo para todas las ciudades; cada predicción queda en su entrada de cache
+    entries = [dataset_cache[city.name] for city in city_list if city.name in dataset_cache]
+    if entries:
+        datasets = [entry['dataset'] for entry in entries]
+        sequences = [dataset[len(dataset)-1][0] for dataset in datasets]
+        for entry, predicted in zip(entries, make_batch_predictions(predictor, sequences, datasets)):
+            entry['prediction'] = (version, predicted)
+
+def predict_next_day_pm25(city_info, full_dataset=None):
     """
     FUNCTION: Predicts PM2.5 for the next day
     PURPOSE: Use LSTM model to generate prediction
+    PARAMETERS: full_dataset (optional, already obtained by the caller via get_city_dataset)
     """
     try:
-        city_data = generate_airvisual_data(city_info)
+        if full_dataset is None:
+            _, full_dataset = get_city_dataset(city_info)
         
-        if city_data is None or len(city_data) < SEQ_LENGTH + 10:
+        if full_dataset is None:
             return None
             
-        if not ensure_model_trained(city_data):
+        if not ensure_model_trained(full_dataset):
             return None
-            
-        full_dataset = AirQualityDataset(city_data, SEQ_LENGTH)
-        last_sequence_data, _ = full_dataset[len(full_dataset)-1]
-        prediction_sequence = last_sequence_data.cpu().numpy()
         
-        predicted_pm25 = make_single_prediction(model, prediction_sequence)
-        
-        if SCALER is not None:
-            last_pm25_scaled = full_dataset.data[-1][0].item()
-            mean_pm25 = SCALER.mean_[0]
-            scale_pm25 = SCALER.scale_[0]
-            current_pm25 = (last_pm25_scaled * scale_pm25) + mean_pm25
+        version, predictor = model_handle  # Snapshot: un re-entrenamiento concurrente no cambia el modelo a mitad de camino
+            
+        # La predicción solo depende del dataset y de la versión del modelo: reutilizarla mientras ambos coincidan
+        entry = dataset_cache.get(city_info.name)
+        if entry is not None and entry['dataset'] is not full_dataset:
+            entry = None               # La entrada en cache ya es de otra serie
+        memo = entry.get('prediction') if entry is not None else None
+        if memo is not None and memo[0] == version:
+            predicted_pm25 = memo[1]
         else:
-            current_pm25 = 25.0
+            prediction_sequence, _ = full_dataset[len(full_dataset)-1]
+            predicted_pm25 = make_single_prediction(predictor, prediction_sequence, full_dataset)
+            if entry is not None and model_handle[0] == version:  # No guardar si el modelo cambió durante el forward
+                entry['prediction'] = (version, predicted_pm25)
+        current_pm25 = full_dataset.data[-1, 0].item() * full_dataset.pm25_scale + full_dataset.pm25_mean
             
         return {
             'current_pm25': round(current_pm25, 1),
@@ -137,6 +357,44 @@ def predict_next_day_pm25(city_info):
         return None
 
 
+@functools.lru_cache(maxsize=32)
+def static_error_body(message):
+    """
+    FUNCTION: Serialized {'success': False, 'message': ...} body, memoized per message
+    PURPOSE: Fixed messages (missing field, generation failed) reuse the same bytes;
+             only for literal messages, never for text containing user input or exceptions
+    """
+    return app.json.dumps({'success': False, 'message': message})
+
+def static_error_response(message, status):
+    """
+    FUNCTION: JSON error response for a fixed message, built from the memoized body
+    """
+    return app.response_class(static_error_body(message), status=status, mimetype='application/json')
+
+def error_response(message, status):
+    """
+    FUNCTION: JSON error response for a message that varies per request (user input, exception text)
+    """
+    return app.response_class(app.json.dumps({'success': False, 'message': message}), status=status, mimetype='application/json')
+
+def json_errors(message):
+    """
+    FUNCTION: Decorator that turns uncaught endpoint exceptions into a JSON 500
+    PARAMETER: message (prefix for the error text returned to the client)
+    PURPOSE: Share a single try/except across all endpoints instead of one per body
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                return view(*args, **kwargs)
+            except Exception as e:
+                return error_response(f'{message}: {str(e)}', 500)
+        return wrapper
+    return decorator
+
+
 # ENDPOINTS DE LA API
 
 @app.route('/api/health', methods=['GET'])
@@ -148,7 +406,7 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'message': 'API Air Quality Predictor working',
-        'timestamp': datetime.now().isoformat(),
+        'timestamp': iso_now(),
         'model_loaded': model is not None,
         'device': str(DEVICE)
     })
@@ -159,287 +417,232 @@ def get_cities():
     ENDPOINT: List of available cities
     RETURNS: JSON with all cities that can be queried
     """
-    cities_list = []
-    for key, city in CITIES.items():
-        cities_list.append({
-            'id': key,
-            'name': city['name'],
-            'city': city['city'],
-            'state': city['state'],
-            'country': city['country']
-        })
-    
-    return jsonify({
-        'success': True,
-        'cities': cities_list,
-        'total': len(cities_list)
-    })
+    return app.response_class(CITIES_RESPONSE_JSON, mimetype='application/json')
 
 @app.route('/api/cities/<city_name>', methods=['GET'])
+@json_errors('Error obteniendo datos')
 def get_city_data(city_name):
     """
     ENDPOINT: Current data for a specific city
     PARAMETER: city_name (name of the city)
     RETURNS: JSON with current data and prediction
     """
-    try:
-        # Buscar ciudad en el diccionario
-        selected_city = None
-        for key, city in CITIES.items():
-            if city['name'].lower() == city_name.lower() or city['city'].lower() == city_name.lower():
-                selected_city = city
-                break
-        
-        if not selected_city:
-            return jsonify({
-                'success': False,
-                'message': f'Ciudad "{city_name}" no encontrada'
-            }), 404
-        
-        # Verificar cache
-        cache_key = f"city_{selected_city['name']}"
-        if cache_key in cached_data:
-            cache_time = cached_data[cache_key]['timestamp']
-            if (datetime.now() - cache_time).seconds < 300:  # Cache de 5 minutos
-                return jsonify(cached_data[cache_key]['data'])
-        
-        # Obtener datos actuales
-        city_data = generate_airvisual_data(selected_city)
-        
-        if city_data is None:
-            return jsonify({
-                'success': False,
-                'message': 'No se pudieron obtener datos para la ciudad'
-            }), 500
-        
-        # Obtener última fila de datos
-        latest_data = city_data.iloc[-1]
-        
-        # Simular datos meteorológicos adicionales
-        weather_data = {
-            'temperature': round(np.random.normal(22, 8), 1),  
-            'humidity': round(np.random.normal(60, 20), 1),    
-            'wind_speed': round(np.random.normal(15, 5), 1),   
-            'pressure': round(np.random.normal(1013, 20), 1)   
-        }
-        
-        # Convertir PM2.5 a AQI para clasificación
-        pm25_value = latest_data['PM2.5']
-        aqi_approx = min(500, max(0, pm25_value * 2))  # Aproximación simple
-        quality_level, quality_emoji = get_aqi_quality_level(aqi_approx)
-        
-        prediction = predict_next_day_pm25(selected_city)
-        
-        response_data = {
-            'success': True,
-            'city': selected_city['name'],
-            'timestamp': datetime.now().isoformat(),
-            'data': {
-                'current': {
-                    'pm25': round(pm25_value, 1),
-                    'no2': round(latest_data['NO2'], 1),
-                    'aqi': round(aqi_approx, 0),
-                    'quality_level': quality_level,
-                    'quality_emoji': quality_emoji,
-                    'weather': weather_data
-                },
-                'prediction': prediction if prediction else {
-                    'current_pm25': round(pm25_value, 1),
-                    'predicted_pm25': round(pm25_value * 0.95, 1),
-                    'prediction_date': (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d'),
-                    'confidence': 0.75
-                }
+    # Buscar ciudad en el diccionario
+    selected_city = CITY_INDEX.get(normalize_city_name(city_name))
+    
+    if not selected_city:
+        return error_response(f'Ciudad "{city_name}" no encontrada', 404)
+    
+    # Verificar cache
+    cache_key = f"city_{selected_city.name}"
+    cached = cached_json_response(cache_key)
+    if cached is not None:
+        return cached
+    
+    # Obtener datos actuales (serie y dataset compartidos con la predicción)
+    city_data, full_dataset = get_city_dataset(selected_city)
+    
+    if city_data is None:
+        return static_error_response('No se pudieron obtener datos para la ciudad', 500)
+    
+    
+    # Simular datos meteorológicos adicionales (las cuatro variables en una sola llamada)
+    temperature, humidity, wind_speed, pressure = weather_rng.normal(WEATHER_MEAN, WEATHER_STD).round(1).tolist()
+    weather_data = {
+        'temperature': temperature,
+        'humidity': humidity,
+        'wind_speed': wind_speed,
+        'pressure': pressure
+    }
+    
+    # Convertir PM2.5 a AQI para clasificación
+    pm25_value = float(city_data.pm25[-1])
+    aqi_approx = min(500, max(0, pm25_value * 2))  # Aproximación simple
+    quality_level, quality_emoji = get_aqi_quality_level(aqi_approx)
+    
+    prediction = predict_next_day_pm25(selected_city, full_dataset)
+    
+    response_data = {
+        'success': True,
+        'city': selected_city.name,
+        'timestamp': iso_now(),
+        'data': {
+            'current': {
+                'pm25': round(pm25_value, 1),
+                'no2': round(float(city_data.no2[-1]), 1),
+                'aqi': round(aqi_approx, 0),
+                'quality_level': quality_level,
+                'quality_emoji': quality_emoji,
+                'weather': weather_data
+            },
+            'prediction': prediction if prediction else {
+                'current_pm25': round(pm25_value, 1),
+                'predicted_pm25': round(pm25_value * 0.95, 1),
+                'prediction_date': (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d'),
+                'confidence': 0.75
             }
         }
-        
-        # Guardar en cache
-        cached_data[cache_key] = {
-            'data': response_data,
-            'timestamp': datetime.now()
-        }
-        
-        return jsonify(response_data)
-        
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'message': f'Error obteniendo datos: {str(e)}'
-        }), 500
+    }
+    
+    # Guardar en cache (cuerpo ya serializado + ETag)
+    return cache_json_response(cache_key, jsonify(response_data))
 
 @app.route('/api/predict', methods=['POST'])
+@json_errors('Error in prediction')
 def predict_city():
     """
     ENDPOINT: Specific prediction for a city
     METHOD: POST with JSON body {'city': 'city_name'}
     RETURNS: JSON with detailed prediction
     """
-    try:
-        data = request.get_json()
-        
-        if not data or 'city' not in data:
-            return jsonify({
-                'success': False,
-                'message': 'The city is missing from the JSON.'
-            }), 400
-        
-        city_name = data['city']
-        
-        # Buscar ciudad
-        selected_city = None
-        for key, city in CITIES.items():
-            if city['name'].lower() == city_name.lower():
-                selected_city = city
-                break
-        
-        if not selected_city:
-            return jsonify({
-                'success': False,
-                'message': f'City "{city_name}" not found.'
-            }), 404
-        
-        # Obtener predicción
-        prediction = predict_next_day_pm25(selected_city)
-        
-        if not prediction:
-            return jsonify({
-                'success': False,
-                'message': 'Failed to generate prediction.'
-            }), 500
-        
-        return jsonify({
-            'success': True,
-            'city': selected_city['name'],
-            'prediction': prediction,
-            'timestamp': datetime.now().isoformat()
-        })
-        
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'message': f'Error in prediction: {str(e)}'
-        }), 500
+    data = request.get_json(silent=True)  # JSON inválido -> None (400 abajo) en vez de una excepción
+    city_name = data.get('city') if isinstance(data, dict) else None
+    
+    if not isinstance(city_name, str):
+        return static_error_response('The city is missing from the JSON.', 400)
+    
+    # Buscar ciudad
+    selected_city = CITY_INDEX.get(normalize_city_name(city_name))
+    
+    if not selected_city:
+        return error_response(f'City "{city_name}" not found.', 404)
+    
+    # Obtener predicción
+    prediction = predict_next_day_pm25(selected_city)
+    
+    if not prediction:
+        return static_error_response('Failed to generate prediction.', 500)
+    
+    return jsonify({
+        'success': True,
+        'city': selected_city.name,
+        'prediction': prediction,
+        'timestamp': iso_now()
+    })
 
 @app.route('/api/train', methods=['POST'])
+@json_errors('Training Error')
 def train_model_endpoint():
     """
     ENDPOINT: Force re-training of the model
     METHOD: POST with JSON body {'city': 'city_name'}
     RETURNS: JSON with training result
     """
-    try:
-        data = request.get_json()
-        city_name = data.get('city', 'Ciudad de México')
-        
-        # Buscar ciudad
-        selected_city = CITIES.get("1")  # Default a Ciudad de México
-        for key, city in CITIES.items():
-            if city['name'].lower() == city_name.lower():
-                selected_city = city
-                break
-        
-        # Eliminar modelo actual para forzar re-entrenamiento
-        if os.path.exists(MODEL_PATH):
-            os.remove(MODEL_PATH)
-        
-        # Obtener datos y entrenar
-        city_data = generate_airvisual_data(selected_city)
-        
-        if city_data is None:
-            return jsonify({
-                'success': False,
-                'message': 'No training data could be obtained'
-            }), 500
-        
-        success = ensure_model_trained(city_data)
-        
-        return jsonify({
-            'success': success,
-            'message': 'Model re-trained successfully' if success else 'Error in training',
-            'city': selected_city['name'],
-            'timestamp': datetime.now().isoformat()
-        })
-        
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'message': f'Training Error: {str(e)}'
-        }), 500
+    data = request.get_json(silent=True) or {}  # Cuerpo vacío o JSON inválido -> ciudad por defecto
+    city_name = data.get('city', 'Ciudad de México') if isinstance(data, dict) else None
+    
+    if not isinstance(city_name, str):
+        return static_error_response('The city must be a string.', 400)
+    
+    # Buscar ciudad
+    selected_city = CITY_INDEX.get(normalize_city_name(city_name)) or get_city_by_id("1")  # Default a Ciudad de México
+    
+    # Obtener datos frescos y entrenar (la serie queda en cache para las predicciones)
+    city_data, full_dataset = cache_city_dataset(selected_city, generate_airvisual_data(selected_city))
+    
+    if city_data is None:
+        return static_error_response('No training data could be obtained', 500)
+    
+    success = ensure_model_trained(full_dataset, force=True)
+    
+    return jsonify({
+        'success': success,
+        'message': 'Model re-trained successfully' if success else 'Error in training',
+        'city': selected_city.name,
+        'timestamp': iso_now()
+    })
 
 @app.route('/api/generate-data/<city_name>', methods=['GET'])
+@json_errors('Error to generate data')
 def generate_city_data(city_name):
     """
     ENDPOINT: Generate new time series for a city
     PARAMETER: city_name (name of the city)
     RETURNS: JSON with generated time series
     """
-    try:
-        # Buscar ciudad
-        selected_city = None
-        for key, city in CITIES.items():
-            if city['name'].lower() == city_name.lower():
-                selected_city = city
-                break
-        
-        if not selected_city:
-            return jsonify({
-                'success': False,
-                'message': f'City "{city_name}" not found.'
-            }), 404
-        
-        # Generar datos
-        city_data = generate_airvisual_data(selected_city)
-        
-        if city_data is None:
-            return jsonify({
-                'success': False,
-                'message': 'Failed to generate data'
-            }), 500
-        
-        # Convertir DataFrame a formato JSON-friendly
-        data_dict = {
-            'dates': city_data['date'].dt.strftime('%Y-%m-%d').tolist(),
-            'pm25': city_data['PM2.5'].round(1).tolist(),
-            'no2': city_data['NO2'].round(1).tolist()
-        }
-        
-        return jsonify({
-            'success': True,
-            'city': selected_city['name'],
-            'data': data_dict,
-            'total_days': len(city_data),
-            'timestamp': datetime.now().isoformat()
-        })
-        
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'message': f'Error to generate data: {str(e)}'
-        }), 500
+    # Buscar ciudad
+    selected_city = CITY_INDEX.get(normalize_city_name(city_name))
+    
+    if not selected_city:
+        return error_response(f'City "{city_name}" not found.', 404)
+    
+    # Verificar cache (respuesta ya serializada)
+    cache_key = f"series_{selected_city.name}"
+    cached = cached_json_response(cache_key)
+    if cached is not None:
+        return cached
+    
+    # Generar datos (reutiliza la serie en cache si sigue vigente)
+    city_data, _ = get_city_dataset(selected_city)
+    
+    if city_data is None:
+        return static_error_response('Failed to generate data', 500)
+    
+    # Convertir serie temporal a formato JSON-friendly (valores numéricos sin pasar por listas de Python)
+    data_dict = {
+        'dates': np.datetime_as_string(city_data.date, unit='D').tolist(),
+        'pm25': json_array(np.round(city_data.pm25, 1)),
+        'no2': json_array(np.round(city_data.no2, 1))
+    }
+    
+    response = jsonify({
+        'success': True,
+        'city': selected_city.name,
+        'data': data_dict,
+        'total_days': len(city_data),
+        'timestamp': iso_now()
+    })
+    
+    # Guardar en cache el cuerpo JSON (los aciertos no vuelven a serializar)
+    return cache_json_response(cache_key, response)
 
 # ========================================
 # INICIALIZACIÓN Y EJECUCIÓN
 # ========================================
 
-if __name__ == '__main__':
+ENDPOINTS_BANNER = """
+ AVAILABLE ENDPOINTS:
+GET  /api/health - Server status
+GET  /api/cities - List of available cities
+GET  /api/cities/{city} - Current data for a city
+POST /api/predict - Make a prediction
+POST /api/train - Train the model
+GET  /api/generate-data/{city} - Generate time series"""
+
+def init_app():
+    """
+    FUNCTION: Startup work shared by the dev server and WSGI servers
+    PURPOSE: Configure threads (1 for request inference; retraining temporarily uses TRAIN_NUM_THREADS),
+             load the model and warm up predictions before serving
+    RETURNS: The Flask app, so a WSGI server can use it as the entry point:
+             gunicorn -w 2 -k gthread --threads 4 -b 0.0.0.0:5000 "app:init_app()"
+    """
     print("Initializing API")
     
+    # Una predicción (1, 10, 2) no se beneficia de hilos intra-op; con peticiones concurrentes solo compiten entre sí.
+    # El ajuste es global del proceso: ensure_model_trained lo sube a TRAIN_NUM_THREADS mientras entrena
+    torch.set_num_threads(1)
+    
     # Inicializar modelo
-    if initialize_model():
+    with model_lock:
+        ok = model is not None or initialize_model()
+    if ok:
+        warm_up_predictions()
         print("API OK")
     else:
         print("API Initialization Failed")
     
-    print("\n AVAILABLE ENDPOINTS:")
-    print("GET  /api/health - Server status")
-    print("GET  /api/cities - List of available cities")
-    print("GET  /api/cities/{city} - Current data for a city")
-    print("POST /api/predict - Make a prediction")
-    print("POST /api/train - Train the model")
-    print("GET  /api/generate-data/{city} - Generate time series")
+    return app
+
+if __name__ == '__main__':
+    init_app()
+    print(ENDPOINTS_BANNER)
 
-    # Ejecutar servidor Flask
+    # Ejecutar servidor Flask (desarrollo). En producción, un servidor WSGI con hilos usando init_app()
+    # como punto de entrada (ver su docstring); la inferencia es CPU (PyTorch), así que workers con
+    # hilos rinden más que greenlets de gevent
     app.run(
         host='0.0.0.0',    # Permitir conexiones externas
         port=5000,         # Puerto 5000
-        debug=True         # Modo desarrollo con recarga automática
-    )
\ No newline at end of file
+        debug=os.getenv('FLASK_DEBUG', '0') == '1'  # Recarga automática y depurador solo con FLASK_DEBUG=1
+    )
@@ -6,4 +6,8 @@ import os
 # Obtén tu API key en: https://www.iqair.com/air-quality-monitors/api
 # Configura la variable de entorno AIRVISUAL_API_KEY
 AIRVISUAL_API_KEY = os.getenv("AIRVISUAL_API_KEY")
-AIRVISUAL_BASE_URL = "http://api.airvisual.com/v2/"
\ No newline at end of file
+AIRVISUAL_BASE_URL = "http://api.airvisual.com/v2/"
+
+# Caché de respuestas de AirVisual
+CACHE_TTL_WEATHER = 300    # Segundos que una respuesta de la API se considera vigente
+CACHE_MAX_CITIES = 128     # Máximo de ciudades guardadas en memoria